@@ -1,12 +1,53 @@
-import json
+import asyncio
+import hashlib
 import os
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import openai
-from core.context import PageIndexContext
+import orjson
+from core.context import PageIndexContext, checkpoint_delta_path, load_checkpoint
 from core.config import ConfigManager
 from core.exceptions import PageIndexError, PageIndexToolError
-from agent.tool_registry import PAGEINDEX_TOOLS, register_tool_functions
+from agent.tool_registry import PAGEINDEX_TOOLS, TOOL_VALIDATORS, register_tool_functions
+
+_SYSTEM_PROMPT: str = """
+You are a PDF document structure extraction agent. Your task is to process PDF documents and extract their hierarchical structure using the following workflow:
+
+1. **PDF Parser**: Always start by parsing the PDF document to extract text and metadata
+2. **TOC Detector**: Detect if the document has a table of contents and analyze its structure
+3. **Structure Extractor**: Extract the document hierarchy using the best strategy:
+   - MANDATORY: Check the TOC Detector summary before strategy selection
+   - If toc_found=true AND has_page_numbers=true → use "toc_with_pages"
+   - If toc_found=true AND has_page_numbers=false → use "toc_no_pages"
+   - If toc_found=false → use "no_toc"
+   - FALLBACK: If any strategy fails due to invalid prerequisites → automatically try "no_toc"
+   - NEVER retry the same strategy twice - implement progressive fallback
+4. **Structure Verifier**: Verify the extracted structure and fix any errors
+5. **Structure Processor**: Generate the final tree structure with requested enhancements
+
+**Important Guidelines:**
+- Use tools sequentially - each tool depends on the output of previous tools
+- When you want several tool invocations in one step, emit a single "batch" call listing them; invocations run in the order given and the batch stops at the first failure
+- Monitor confidence scores and implement fallback strategies
+- Always handle tool failures gracefully with appropriate error messages
+- Save intermediate state for diagnostic purposes
+- Document state is kept between tool calls for you; tool results only report a summary
+
+**Strategy Selection Logic:**
+- High confidence (>0.8): Proceed to next step
+- Medium confidence (0.6-0.8): Proceed but may need verification/fixing
+- Low confidence (<0.6): Try fallback strategy
+
+**Error Handling:**
+- Tool failures should trigger appropriate recovery strategies
+- Save diagnostic information for manual inspection
+- Provide clear error messages and recovery suggestions
+
+Start by parsing the PDF document provided by the user.
+"""
+
+# Shared by every request so the cached prompt prefix is always identical
+_SYSTEM_PROMPT_MESSAGE: Dict[str, str] = {"role": "system", "content": _SYSTEM_PROMPT}
 
 class PageIndexAgent:
     """
@@ -15,17 +56,23 @@ class PageIndexAgent:
     """
     
     def __init__(self, api_key: str = None, config_overrides: Dict[str, Any] = None, verbose: bool = False):
-        self.client = openai.OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+        self.client = openai.AsyncOpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
         self.config_manager = ConfigManager()
         self.config = self.config_manager.load_config(config_overrides)
-        self.tool_functions = register_tool_functions()
+        self._context_store: Dict[str, PageIndexContext] = {}
+        self.tool_functions = register_tool_functions(self._context_store)
         self.verbose = verbose
+        self._session_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        
+        # Agent turns keyed on a hash of the full request
+        self._llm_cache: Dict[str, Dict[str, Any]] = {}
+        self._llm_cache_stats = {"hits": 0, "misses": 0}
         
         # Setup logging directory
         log_dir = Path(self.config.global_config.log_dir)
         log_dir.mkdir(parents=True, exist_ok=True)
     
-    def process_pdf(self, pdf_path: str) -> Dict[str, Any]:
+    async def process_pdf(self, pdf_path: str) -> Dict[str, Any]:
         """
         Main entry point for PDF structure extraction
         
@@ -40,12 +87,9 @@ class PageIndexAgent:
             # Initialize context
             context = PageIndexContext(self.config)
             
-            # Create system prompt for agent orchestration
-            system_prompt = self._create_system_prompt()
-            
             # Start agent conversation
             messages = [
-                {"role": "system", "content": system_prompt},
+                _SYSTEM_PROMPT_MESSAGE,
                 {"role": "user", "content": f"Process PDF document: {pdf_path}"}
             ]
             
@@ -56,87 +100,95 @@ class PageIndexAgent:
             while iteration < max_iterations:
                 iteration += 1
                 
-                response = self.client.chat.completions.create(
-                    model=self.config.global_config.model,
-                    messages=messages,
-                    tools=PAGEINDEX_TOOLS,
-                    tool_choice="auto",
-                    temperature=0
-                )
+                # Tool calls start running while the rest of the turn streams in
+                runner = _ToolCallRunner(self, context)
+                try:
+                    message = await self._request_turn(messages, context, runner)
+                    outcomes = await runner.results()
+                except BaseException:
+                    runner.cancel()
+                    raise
                 
-                message = response.choices[0].message
-                messages.append(message.model_dump())
+                messages.append(message)
+                
+                if not runner.tool_calls:
+                    # No more tool calls, agent finished
+                    break
                 
-                # Handle tool calls
-                if message.tool_calls:
-                    for tool_call in message.tool_calls:
-                        function_name = tool_call.function.name
-                        function_args = json.loads(tool_call.function.arguments)
+                # Apply results in emitted order
+                for tool_call, outcome in zip(runner.tool_calls, outcomes):
+                    function_name = tool_call["function"]["name"]
+                    
+                    try:
+                        if isinstance(outcome, BaseException):
+                            raise outcome
+                        result, tool_context = outcome
+                        
+                        # Update context from tool result
+                        if result["success"]:
+                            context = tool_context
                         
                         if self.verbose:
-                            print(f"[Agent] Calling tool: {function_name}")
+                            if result["success"]:
+                                print(f"[Agent] Tool {function_name} completed successfully")
+                            else:
+                                print(f"[Agent] Tool {function_name} failed")
                         
-                        # Inject current context into tool call
-                        function_args["context"] = context.to_dict()
+                        # Add tool response to conversation
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call["id"],
+                            "content": orjson.dumps(result).decode()
+                        })
                         
-                        # Execute tool
-                        try:
-                            tool_function = self.tool_functions[function_name]
-                            result = tool_function(**function_args)
+                        # Check for tool failures
+                        if not result["success"]:
+                            error_msg = f"Tool {function_name} failed: {result.get('errors', [])}"
+                            if result.get("suggestions"):
+                                error_msg += f"\nSuggestions: {result['suggestions']}"
+                            raise PageIndexToolError(error_msg)
                             
-                            # Update context from tool result
-                            if result["success"]:
-                                context = PageIndexContext.from_dict(result["context"])
-                            
-                            if self.verbose:
-                                if result["success"]:
-                                    print(f"[Agent] Tool {function_name} completed successfully")
-                                else:
-                                    print(f"[Agent] Tool {function_name} failed")
-                            
-                            # Add tool response to conversation
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": tool_call.id,
-                                "content": json.dumps(result)
-                            })
-                            
-                            # Check for tool failures
-                            if not result["success"]:
-                                error_msg = f"Tool {function_name} failed: {result.get('errors', [])}"
-                                if result.get("suggestions"):
-                                    error_msg += f"\nSuggestions: {result['suggestions']}"
-                                raise PageIndexToolError(error_msg)
-                                
-                        except Exception as e:
-                            # Handle tool execution errors
-                            error_result = {
-                                "success": False,
-                                "error": str(e),
-                                "context": context.to_dict()
-                            }
-                            
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": tool_call.id,
-                                "content": json.dumps(error_result)
-                            })
-                            
-                            # Save failure state for diagnostics
-                            log_dir = Path(self.config.global_config.log_dir) / context.session_id
-                            log_dir.mkdir(parents=True, exist_ok=True)
-                            context.log_step("agent", "tool_failed", {
-                                "tool": function_name,
-                                "error": str(e)
-                            })
-                            context.save_checkpoint(log_dir, include_pages=True)
-                            
-                            raise PageIndexError(f"Tool execution failed: {str(e)}")
-                else:
-                    # No more tool calls, agent finished
+                    except Exception as e:
+                        # Handle tool execution errors
+                        error_result = {
+                            "success": False,
+                            "error": str(e)
+                        }
+                        
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call["id"],
+                            "content": orjson.dumps(error_result).decode()
+                        })
+                        
+                        # A retry must ask the model again rather than replay this turn
+                        if runner.cache_entry is not None:
+                            self._llm_cache.pop(runner.cache_entry[0], None)
+                        
+                        # Save failure state for diagnostics
+                        log_dir = Path(self.config.global_config.log_dir) / context.session_id
+                        log_dir.mkdir(parents=True, exist_ok=True)
+                        context.log_step("agent", "tool_failed", {
+                            "tool": function_name,
+                            "error": str(e)
+                        })
+                        context.save_checkpoint(log_dir, include_pages=True)
+                        
+                        raise PageIndexError(f"Tool execution failed: {str(e)}")
+                
+                # Every tool call in the turn succeeded, so the turn can be replayed
+                if runner.cache_entry is not None:
+                    key, cached_message = runner.cache_entry
+                    self._llm_cache[key] = cached_message
+                
+                # A final structure is the terminal state, so skip the model's closing turn
+                if context.structure_final:
+                    context.log_step("agent", "terminated_early", {
+                        "iteration": iteration,
+                        "llm_turns_saved": 1
+                    })
                     break
-            
-            if iteration >= max_iterations:
+            else:
                 raise PageIndexError("Maximum iterations reached, processing may be incomplete")
             
             # Return final result
@@ -157,42 +209,121 @@ class PageIndexAgent:
             
             raise
     
+    async def _request_turn(self, messages: List[Dict[str, Any]], context: PageIndexContext,
+                            runner: "_ToolCallRunner") -> Dict[str, Any]:
+        """
+        Stream the next agent turn, handing each tool call to the runner once decoded
+        
+        Identical earlier requests are answered from the LLM cache. A turn with
+        tool calls is left on runner.cache_entry and only cached by process_pdf
+        once all of its tool calls succeed.
+        
+        Returns:
+            Assistant message to append to the conversation
+        """
+        request = {
+            "model": self.config.global_config.model,
+            "messages": messages,
+            "tools": PAGEINDEX_TOOLS,
+            "tool_choice": "auto",
+            "temperature": 0
+        }
+        # temperature=0 makes the next turn a function of the request alone
+        key = hashlib.sha256(orjson.dumps(request, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        
+        cached = self._llm_cache.get(key)
+        if cached is not None:
+            self._llm_cache_stats["hits"] += 1
+            context.log_step("agent", "llm_cache_hit", dict(self._llm_cache_stats))
+            runner.cache_entry = (key, cached)
+            for tool_call in cached.get("tool_calls", []):
+                runner.submit(tool_call)
+            return cached
+        
+        self._llm_cache_stats["misses"] += 1
+        context.log_step("agent", "llm_cache_miss", dict(self._llm_cache_stats))
+        
+        stream = await self.client.chat.completions.create(**request, stream=True)
+        content_parts = []
+        tool_calls: List[Dict[str, Any]] = []
+        
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+            
+            for call_delta in delta.tool_calls or []:
+                if call_delta.index >= len(tool_calls):
+                    # Tool calls stream one after another, so the previous one is complete
+                    if tool_calls:
+                        runner.submit(tool_calls[-1])
+                    tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                
+                call = tool_calls[call_delta.index]
+                if call_delta.id:
+                    call["id"] = call_delta.id
+                if call_delta.function:
+                    call["function"]["name"] += call_delta.function.name or ""
+                    call["function"]["arguments"] += call_delta.function.arguments or ""
+        
+        if tool_calls:
+            runner.submit(tool_calls[-1])
+        
+        message: Dict[str, Any] = {"role": "assistant"}
+        if content_parts:
+            message["content"] = "".join(content_parts)
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        
+        message = self._serialize_message(message)
+        if tool_calls:
+            # Cached by process_pdf only once every tool call in the turn succeeds
+            runner.cache_entry = (key, message)
+        else:
+            self._llm_cache[key] = message
+        return message
+    
+    @staticmethod
+    def _serialize_message(message: Dict[str, Any]) -> Dict[str, Any]:
+        """Rebuild a message with sorted keys so prompt-cache prefixes stay stable"""
+        return orjson.loads(orjson.dumps(message, option=orjson.OPT_SORT_KEYS))
+    
+    async def _run_tool_call(self, tool_call: Dict[str, Any],
+                             context: PageIndexContext) -> Tuple[Dict[str, Any], PageIndexContext]:
+        """Run one tool call on the given context"""
+        # Each call gets its own handle onto the input context
+        handle = f"{context.session_id}/{tool_call['id']}"
+        self._context_store[handle] = context
+        try:
+            result = await self._execute_tool(tool_call, handle)
+            return result, self._context_store[handle]
+        finally:
+            self._context_store.pop(handle, None)
+    
+    async def _execute_tool(self, tool_call: Dict[str, Any], context_id: str) -> Dict[str, Any]:
+        """Run a single tool call, off the event loop for synchronous tools"""
+        function_name = tool_call["function"]["name"]
+        function_args = orjson.loads(tool_call["function"]["arguments"] or "{}")
+        
+        if self.verbose:
+            print(f"[Agent] Calling tool: {function_name}")
+        
+        # Reject malformed arguments before spending a tool run on them
+        tool_function = self.tool_functions[function_name]
+        TOOL_VALIDATORS[function_name](function_args)
+        
+        # Tools resolve the live context from the store by handle
+        function_args["context_id"] = context_id
+        
+        if asyncio.iscoroutinefunction(tool_function):
+            return await tool_function(**function_args)
+        return await asyncio.to_thread(tool_function, **function_args)
+    
     def _create_system_prompt(self) -> str:
         """Create system prompt for agent orchestration"""
-        return """
-You are a PDF document structure extraction agent. Your task is to process PDF documents and extract their hierarchical structure using the following workflow:
-
-1. **PDF Parser**: Always start by parsing the PDF document to extract text and metadata
-2. **TOC Detector**: Detect if the document has a table of contents and analyze its structure
-3. **Structure Extractor**: Extract the document hierarchy using the best strategy:
-   - MANDATORY: Check context.toc_info state before strategy selection
-   - If context.toc_info.found=true AND context.toc_info.has_page_numbers=true → use "toc_with_pages"
-   - If context.toc_info.found=true AND context.toc_info.has_page_numbers=false → use "toc_no_pages"
-   - If context.toc_info.found=false → use "no_toc"
-   - FALLBACK: If any strategy fails due to invalid prerequisites → automatically try "no_toc"
-   - NEVER retry the same strategy twice - implement progressive fallback
-4. **Structure Verifier**: Verify the extracted structure and fix any errors
-5. **Structure Processor**: Generate the final tree structure with requested enhancements
-
-**Important Guidelines:**
-- Use tools sequentially - each tool depends on the output of previous tools
-- Monitor confidence scores and implement fallback strategies
-- Always handle tool failures gracefully with appropriate error messages
-- Save intermediate state for diagnostic purposes
-- The context object carries all state between tool calls
-
-**Strategy Selection Logic:**
-- High confidence (>0.8): Proceed to next step
-- Medium confidence (0.6-0.8): Proceed but may need verification/fixing
-- Low confidence (<0.6): Try fallback strategy
-
-**Error Handling:**
-- Tool failures should trigger appropriate recovery strategies
-- Save diagnostic information for manual inspection
-- Provide clear error messages and recovery suggestions
-
-Start by parsing the PDF document provided by the user.
-"""
+        return _SYSTEM_PROMPT
     
     def get_processing_status(self, session_id: str) -> Dict[str, Any]:
         """Get processing status for a session"""
@@ -203,8 +334,7 @@ Start by parsing the PDF document provided by the user.
             return {"status": "not_found"}
         
         try:
-            with open(checkpoint_file, 'r') as f:
-                checkpoint = json.load(f)
+            checkpoint = load_checkpoint(checkpoint_file)
             
             return {
                 "status": "found",
@@ -220,22 +350,88 @@ Start by parsing the PDF document provided by the user.
         log_dir = Path(self.config.global_config.log_dir)
         sessions = []
         
-        if log_dir.exists():
-            for session_dir in log_dir.iterdir():
-                if session_dir.is_dir():
-                    checkpoint_file = session_dir / f"{session_dir.name}_checkpoint.json"
-                    if checkpoint_file.exists():
-                        try:
-                            with open(checkpoint_file, 'r') as f:
-                                checkpoint = json.load(f)
-                            
-                            sessions.append({
-                                "session_id": session_dir.name,
-                                "current_step": checkpoint.get("current_step", "unknown"),
-                                "pdf_name": checkpoint.get("pdf_metadata", {}).get("pdf_name", "unknown"),
-                                "last_update": checkpoint_file.stat().st_mtime
-                            })
-                        except Exception:
-                            continue
+        if not log_dir.exists():
+            return sessions
+        
+        with os.scandir(log_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                
+                checkpoint_file = os.path.join(entry.path, f"{entry.name}_checkpoint.json")
+                try:
+                    mtime = os.stat(checkpoint_file).st_mtime
+                except OSError:
+                    continue
+                
+                # Appended delta records also count as an update
+                try:
+                    mtime = max(mtime, os.stat(checkpoint_delta_path(checkpoint_file)).st_mtime)
+                except OSError:
+                    pass
+                
+                # Only re-parse checkpoints that changed since the last listing
+                cached = self._session_cache.get(entry.name)
+                if cached is None or cached[0] != mtime:
+                    try:
+                        checkpoint = load_checkpoint(checkpoint_file)
+                    except Exception:
+                        continue
+                    
+                    cached = (mtime, {
+                        "session_id": entry.name,
+                        "current_step": checkpoint.get("current_step", "unknown"),
+                        "pdf_name": checkpoint.get("pdf_metadata", {}).get("pdf_name", "unknown"),
+                        "last_update": mtime
+                    })
+                    self._session_cache[entry.name] = cached
+                
+                sessions.append(dict(cached[1]))
         
         return sorted(sessions, key=lambda x: x["last_update"], reverse=True)
+
+
+class _ToolCallRunner:
+    """
+    Starts tool calls for one agent turn as soon as they are decoded
+    
+    Calls run one at a time in emitted order, each on the context left by the
+    previous call, so the first call overlaps with the rest of the turn
+    streaming in. Calls after a failed one are never run.
+    """
+    
+    def __init__(self, agent: PageIndexAgent, context: PageIndexContext):
+        self._agent = agent
+        self._context = context
+        self.cache_entry: Optional[Tuple[str, Dict[str, Any]]] = None  # (LLM cache key, message) of a tool-calling turn
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.tasks: List[asyncio.Task] = []
+    
+    def submit(self, tool_call: Dict[str, Any]):
+        """Start a fully decoded tool call once the previous call has finished"""
+        self.tool_calls.append(tool_call)
+        previous = self.tasks[-1] if self.tasks else None
+        self.tasks.append(asyncio.ensure_future(self._run_after(previous, tool_call)))
+    
+    async def _run_after(self, previous: Optional[asyncio.Task],
+                         tool_call: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], PageIndexContext]]:
+        """Run a tool call on the previous call's context, or return None if that call failed"""
+        context = self._context
+        if previous is not None:
+            try:
+                outcome = await previous
+            except Exception:
+                return None
+            if outcome is None or not outcome[0]["success"]:
+                return None
+            context = outcome[1]
+        return await self._agent._run_tool_call(tool_call, context)
+    
+    async def results(self) -> List[Any]:
+        """Wait for every submitted call; outcomes are in emitted order"""
+        return await asyncio.gather(*self.tasks, return_exceptions=True)
+    
+    def cancel(self):
+        """Cancel calls that are still pending"""
+        for task in self.tasks:
+            task.cancel()
@@ -1,4 +1,8 @@
-from typing import Dict, Callable
+import asyncio
+import functools
+from typing import Dict, Any, Callable, List
+from core.context import PageIndexContext
+from core.exceptions import PageIndexToolError
 from tools.pdf_parser import pdf_parser_tool
 from tools.toc_detector import toc_detector_tool
 from tools.structure_extractor import structure_extractor_tool
@@ -15,16 +19,12 @@ PAGEINDEX_TOOLS = [
             "parameters": {
                 "type": "object", 
                 "properties": {
-                    "context": {
-                        "type": "object",
-                        "description": "Current PageIndex context"
-                    },
                     "pdf_path": {
                         "type": "string", 
                         "description": "Path to PDF file to process"
                     }
                 },
-                "required": ["context", "pdf_path"]
+                "required": ["pdf_path"]
             }
         }
     },
@@ -35,13 +35,8 @@ PAGEINDEX_TOOLS = [
             "description": "Detect table of contents in document and analyze structure",
             "parameters": {
                 "type": "object",
-                "properties": {
-                    "context": {
-                        "type": "object",
-                        "description": "Current PageIndex context with pages data"
-                    }
-                },
-                "required": ["context"]
+                "properties": {},
+                "required": []
             }
         }
     },
@@ -49,21 +44,17 @@ PAGEINDEX_TOOLS = [
         "type": "function",
         "function": {
             "name": "structure_extractor",
-            "description": "Extract document hierarchy using specified strategy. STRATEGY SELECTION: Use 'toc_with_pages' only if context.toc_info.found=true AND context.toc_info.has_page_numbers=true. Use 'toc_no_pages' only if context.toc_info.found=true AND context.toc_info.has_page_numbers=false. Use 'no_toc' if context.toc_info.found=false OR as fallback when other strategies fail.",
+            "description": "Extract document hierarchy using specified strategy. STRATEGY SELECTION (from the toc_detector summary): Use 'toc_with_pages' only if toc_found=true AND has_page_numbers=true. Use 'toc_no_pages' only if toc_found=true AND has_page_numbers=false. Use 'no_toc' if toc_found=false OR as fallback when other strategies fail.",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "context": {
-                        "type": "object",
-                        "description": "Current PageIndex context with pages and toc_info"
-                    },
                     "strategy": {
                         "type": "string",
                         "enum": ["toc_with_pages", "toc_no_pages", "no_toc"],
                         "description": "Extraction strategy to use"
                     }
                 },
-                "required": ["context", "strategy"]
+                "required": ["strategy"]
             }
         }
     },
@@ -74,13 +65,8 @@ PAGEINDEX_TOOLS = [
             "description": "Verify structure accuracy and fix errors",
             "parameters": {
                 "type": "object",
-                "properties": {
-                    "context": {
-                        "type": "object",
-                        "description": "Current PageIndex context with structure_raw"
-                    }
-                },
-                "required": ["context"]
+                "properties": {},
+                "required": []
             }
         }
     },
@@ -92,10 +78,6 @@ PAGEINDEX_TOOLS = [
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "context": {
-                        "type": "object",
-                        "description": "Current PageIndex context with structure_verified"
-                    },
                     "enhancements": {
                         "type": "array",
                         "items": {
@@ -105,18 +87,154 @@ PAGEINDEX_TOOLS = [
                         "description": "List of enhancements to apply"
                     }
                 },
-                "required": ["context"]
+                "required": []
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "batch",
+            "description": "Run several tool invocations in one step. Invocations run in the order given, each on the result of the previous one, and the batch stops at the first failure.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "invocations": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "tool_name": {
+                                    "type": "string",
+                                    "enum": ["pdf_parser", "toc_detector", "structure_extractor", "structure_verifier", "structure_processor"]
+                                },
+                                "arguments": {
+                                    "type": "object",
+                                    "description": "Arguments for the tool, as in its own schema"
+                                }
+                            },
+                            "required": ["tool_name"]
+                        },
+                        "description": "Tool invocations in the order they were planned"
+                    }
+                },
+                "required": ["invocations"]
             }
         }
     }
 ]
 
-def register_tool_functions() -> Dict[str, Callable]:
-    """Register actual tool functions for Agent SDK"""
-    return {
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "number": (int, float)
+}
+
+def _compile_validator(schema: Dict[str, Any]) -> Callable[..., None]:
+    """Compile the JSON-schema subset used by PAGEINDEX_TOOLS into a checking function"""
+    expected_type = _JSON_TYPES[schema["type"]] if "type" in schema else None
+    enum = frozenset(schema["enum"]) if "enum" in schema else None
+    required = tuple(schema.get("required", ()))
+    properties = {name: _compile_validator(sub) for name, sub in schema.get("properties", {}).items()}
+    items = _compile_validator(schema["items"]) if "items" in schema else None
+    
+    def validate(value: Any, path: str = "arguments") -> None:
+        if expected_type is not None and not isinstance(value, expected_type):
+            raise PageIndexToolError(f"{path} must be of type {schema['type']}")
+        if enum is not None and value not in enum:
+            raise PageIndexToolError(f"{path} must be one of {sorted(enum)}, got {value!r}")
+        for name in required:
+            if name not in value:
+                raise PageIndexToolError(f"{path} is missing required property '{name}'")
+        for name, check in properties.items():
+            if name in value:
+                check(value[name], f"{path}.{name}")
+        if items is not None:
+            for index, item in enumerate(value):
+                items(item, f"{path}[{index}]")
+    
+    return validate
+
+# Argument validators compiled once from the tool schemas
+TOOL_VALIDATORS: Dict[str, Callable[..., None]] = {
+    tool["function"]["name"]: _compile_validator(tool["function"]["parameters"])
+    for tool in PAGEINDEX_TOOLS
+}
+
+def summarize_tool_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a tool result to the compact form sent back to the model"""
+    summary = dict(result.get("metrics") or {})
+    context = result.get("context")
+    if context:
+        summary["current_step"] = context.get("current_step")
+    
+    compact = {"success": result["success"], "summary": summary}
+    for key in ("confidence", "errors", "suggestions"):
+        if result.get(key) is not None:
+            compact[key] = result[key]
+    return compact
+
+def with_context_handle(tool_function: Callable, context_store: Dict[str, PageIndexContext]) -> Callable:
+    """
+    Wrap a tool so it works on a stored context instead of a serialized one
+    
+    The wrapped tool takes a context_id, reads the live context from the
+    store, replaces it with the updated context on success and returns only
+    a compact summary.
+    """
+    @functools.wraps(tool_function)
+    def wrapper(context_id: str, **kwargs) -> Dict[str, Any]:
+        context = context_store[context_id]
+        result = tool_function(context=context.to_dict(), **kwargs)
+        if result["success"]:
+            context_store[context_id] = PageIndexContext.from_dict(result["context"])
+        return summarize_tool_result(result)
+    
+    return wrapper
+
+def register_tool_functions(context_store: Dict[str, PageIndexContext]) -> Dict[str, Callable]:
+    """Register actual tool functions for Agent SDK, bound to a context store"""
+    tools = {
         "pdf_parser": pdf_parser_tool,
         "toc_detector": toc_detector_tool,
         "structure_extractor": structure_extractor_tool,
         "structure_verifier": structure_verifier_tool,
         "structure_processor": structure_processor_tool
     }
+    registered = {name: with_context_handle(tool, context_store) for name, tool in tools.items()}
+    registered["batch"] = make_batch_tool(registered, context_store)
+    return registered
+
+def make_batch_tool(tool_functions: Dict[str, Callable], context_store: Dict[str, PageIndexContext]) -> Callable:
+    """
+    Build the batch meta-tool over already registered tools
+    
+    Invocations run in the order given, each on the context left by the
+    previous one, and the batch stops at the first failure.
+    """
+    async def batch_tool(context_id: str, invocations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        results: List[Dict[str, Any]] = []
+        
+        for index, invocation in enumerate(invocations):
+            name = invocation["tool_name"]
+            arguments = invocation.get("arguments") or {}
+            try:
+                TOOL_VALIDATORS[name](arguments, f"invocations[{index}].arguments")
+                outcome = await asyncio.to_thread(tool_functions[name], context_id=context_id, **arguments)
+            except Exception as e:
+                outcome = {"success": False, "errors": [str(e)]}
+            results.append({"tool_name": name, **outcome})
+            
+            if not outcome["success"]:
+                break
+        
+        errors = [f"{result['tool_name']}: {error}" for result in results for error in result.get("errors") or []]
+        return {
+            "success": len(results) == len(invocations) and all(result["success"] for result in results),
+            "results": results,
+            "errors": errors
+        }
+    
+    return batch_tool
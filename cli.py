@@ -4,11 +4,26 @@ Command-line interface for PageIndex Agent
 """
 
 import argparse
-import json
+import asyncio
+import orjson
 import sys
+from collections import deque
 from pathlib import Path
 from agent.pageindex_agent import PageIndexAgent
 
+def count_nodes(structure) -> int:
+    """Count nodes in a structure tree with an explicit stack instead of recursion"""
+    count = 0
+    stack = deque([structure])
+    while stack:
+        nodes = stack.pop()
+        if isinstance(nodes, list):
+            count += len(nodes)
+            stack.extend(node['nodes'] for node in nodes if 'nodes' in node)
+        else:
+            count += 1
+    return count
+
 def main():
     """Main CLI entry point"""
     parser = argparse.ArgumentParser(description='PageIndex Agent - Extract PDF document structure')
@@ -103,7 +118,7 @@ def main():
         if args.verbose:
             print(f"Processing PDF: {args.pdf_path}")
         
-        result = agent.process_pdf(args.pdf_path)
+        result = asyncio.run(agent.process_pdf(args.pdf_path))
         
         # Determine output path
         if args.output:
@@ -114,8 +129,8 @@ def main():
         
         # Save results
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         
         print("Processing completed successfully!")
         print(f"Results saved to: {output_path}")
@@ -125,16 +140,6 @@ def main():
             if 'doc_description' in result:
                 print(f"Description: {result['doc_description']}")
             
-            # Count nodes
-            def count_nodes(structure):
-                if isinstance(structure, list):
-                    count = len(structure)
-                    for node in structure:
-                        if 'nodes' in node:
-                            count += count_nodes(node['nodes'])
-                    return count
-                return 1
-            
             total_nodes = count_nodes(result['structure'])
             print(f"Total sections extracted: {total_nodes}")
         
@@ -0,0 +1,79 @@
+"""
+Persistent response cache for deterministic (temperature=0) LLM calls
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+import orjson
+
+# Directory for the on-disk cache; caching is off when unset
+CACHE_DIR_ENV = "PAGEINDEX_LLM_CACHE_DIR"
+
+# Cached responses expire after 30 days
+DEFAULT_EXPIRE_SECONDS = 30 * 86400
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """SHA-256 of the canonical JSON form of a request payload"""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed string store with per-entry expiry, safe to share across threads"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "responses.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        # Drop entries that expired since the cache was last opened
+        self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value, or None when missing or expired; expired entries are deleted"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                self._conn.execute("DELETE FROM responses WHERE key = ? AND expires_at = ?", (key, expires_at))
+                return None
+        return value
+
+    def set(self, key: str, value: str, expire: Optional[float] = DEFAULT_EXPIRE_SECONDS) -> None:
+        """Store a value, replacing any previous entry for the key"""
+        expires_at = time.time() + expire if expire is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+
+
+# One open cache per directory for the life of the process
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Shared cache for the directory named by PAGEINDEX_LLM_CACHE_DIR, or None if unset"""
+    directory = os.getenv(CACHE_DIR_ENV)
+    if not directory:
+        return None
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = ResponseCache(directory)
+    return cache
@@ -1,93 +1,133 @@
-from dataclasses import dataclass
-from typing import Dict, Any
+import copy
+import os
+from dataclasses import asdict
+from typing import Dict, Any, Optional, Tuple
+import orjson
 import yaml
 from pathlib import Path
 from core.config_schema import PageIndexConfig, merge_configs
 from core.exceptions import PageIndexError
 
-@dataclass
-class GlobalConfig:
-    model: str = "gpt-4.1-mini"
-    log_dir: str = "./logs"
-    session_timeout: int = 3600
+def _build_defaults() -> Dict[str, Dict[str, Any]]:
+    """Default values for every config section, keyed by YAML section name"""
+    defaults = asdict(PageIndexConfig())
+    defaults["global"] = defaults.pop("global_config")
+    return defaults
 
-@dataclass  
-class PDFParserConfig:
-    pdf_parser: str = "PyMuPDF"  # or "pypdf"
-    
-@dataclass
-class TOCDetectorConfig:
-    toc_check_page_num: int = 20
-    
-@dataclass
-class StructureExtractorConfig:
-    max_token_num_each_node: int = 20000
-    max_retries: int = 3
+# Built once at import; treat as read-only
+_DEFAULTS: Dict[str, Dict[str, Any]] = _build_defaults()
+
+# Legacy flat keys and the section each one moved to
+_LEGACY_KEYS: Dict[str, Tuple[str, ...]] = {
+    "global": ("model",),
+    "toc_detector": ("toc_check_page_num",),
+    "structure_processor": (
+        "max_page_num_each_node",
+        "if_add_node_id",
+        "if_add_node_summary",
+        "if_add_doc_description",
+        "if_add_node_text"
+    ),
+    "structure_extractor": ("max_token_num_each_node",)
+}
+
+# libyaml-backed loader and dumper when available, pure-Python otherwise
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# Parsed config files keyed on path, tagged with the (mtime_ns, size) they were read at
+_CONFIG_CACHE: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+# asdict() of validated configs keyed on (path, file signature, serialized overrides)
+_VALIDATED_CACHE: Dict[Tuple[str, Optional[Tuple[int, int]], bytes], Dict[str, Any]] = {}
+
+def _file_signature(config_path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of a config file, or None when it does not exist"""
+    try:
+        stat = os.stat(config_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _load_yaml_cached(config_path: str, signature: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """Parse a YAML config file, reusing the last parse while the file is unchanged"""
+    if signature is None:
+        signature = _file_signature(config_path)
+        if signature is None:
+            return {}
     
-@dataclass
-class StructureVerifierConfig:
-    max_fix_attempts: int = 3
-    accuracy_threshold: float = 0.6
+    path = os.fspath(config_path)
+    cached = _CONFIG_CACHE.get(path)
+    if cached is None or cached[0] != signature:
+        with open(config_path, 'r') as f:
+            cached = (signature, yaml.load(f, Loader=_Loader) or {})
+        _CONFIG_CACHE[path] = cached
     
-@dataclass
-class StructureProcessorConfig:
-    max_page_num_each_node: int = 10
-    if_add_node_id: str = "yes"
-    if_add_node_summary: str = "no" 
-    if_add_doc_description: str = "yes"
-    if_add_node_text: str = "no"
+    # Callers merge overrides into the result, so never hand out the cached dict
+    return copy.deepcopy(cached[1])
+
+def _validate_config(config_dict: Dict[str, Any]) -> PageIndexConfig:
+    """Validate a merged config dict against the schema"""
+    try:
+        return PageIndexConfig.from_dict(config_dict)
+    except Exception as e:
+        raise PageIndexError(f"Configuration validation failed: {str(e)}")
+
+# Bundled config.yaml at the repository root, resolved once at import
+_DEFAULT_CONFIG_PATH = str(Path(__file__).resolve().parent.parent / "config.yaml")
 
 class ConfigManager:
     def __init__(self, config_path: str = None):
-        self.config_path = config_path or Path(__file__).parent.parent / "config.yaml"
+        # Kept as a plain string: it is stat'ed and used as a cache key on every load
+        self.config_path = os.fspath(config_path) if config_path else _DEFAULT_CONFIG_PATH
     
-    def load_config(self, user_overrides: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Load configuration with user overrides and validation"""
+    def load_config(self, user_overrides: Dict[str, Any] = None) -> PageIndexConfig:
+        """Load configuration with user overrides and validation
+        
+        Validated configs are cached per file signature and overrides, so
+        repeated calls skip validation until the file changes. Each call
+        returns its own instance, so callers may mutate the result.
+        """
+        signature = _file_signature(self.config_path)
+        cache_key = (
+            self.config_path,
+            signature,
+            orjson.dumps(user_overrides or {}, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        )
+        cached = _VALIDATED_CACHE.get(cache_key)
+        if cached is not None:
+            return PageIndexConfig.from_dict_unchecked(cached)
+        
         # Load default config
-        if Path(self.config_path).exists():
-            with open(self.config_path, 'r') as f:
-                base_config = yaml.safe_load(f) or {}
-        else:
-            base_config = {}
-            
+        base_config = _load_yaml_cached(self.config_path, signature) if signature else {}
+        
         # Apply user overrides
         if user_overrides:
             base_config = merge_configs(base_config, user_overrides)
         
-        # Validate configuration using schema
-        try:
-            validated_config = PageIndexConfig.from_dict(base_config)
-            return validated_config
-        except Exception as e:
-            raise PageIndexError(f"Configuration validation failed: {str(e)}")
+        validated_config = _validate_config(base_config)
+        _VALIDATED_CACHE[cache_key] = asdict(validated_config)
+        return validated_config
+    
+    def load_raw(self, raw_config: Dict[str, Any], user_overrides: Dict[str, Any] = None) -> PageIndexConfig:
+        """Validate an in-memory config dict with user overrides, bypassing the config file"""
+        if user_overrides:
+            raw_config = merge_configs(raw_config, user_overrides)
+        return _validate_config(raw_config)
     
     def migrate_legacy_config(self, legacy_config_path: str, output_path: str = None):
         """Migrate legacy config.yaml to new hierarchical structure"""
         with open(legacy_config_path, 'r') as f:
-            legacy_config = yaml.safe_load(f) or {}
+            legacy_config = yaml.load(f, Loader=_Loader) or {}
         
-        # Map legacy keys to new structure
+        # Map legacy keys to new structure, falling back to schema defaults
         new_config = {
-            "global": {
-                "model": legacy_config.get("model", "gpt-4.1-mini")
-            },
-            "toc_detector": {
-                "toc_check_page_num": legacy_config.get("toc_check_page_num", 20)
-            },
-            "structure_processor": {
-                "max_page_num_each_node": legacy_config.get("max_page_num_each_node", 10),
-                "if_add_node_id": legacy_config.get("if_add_node_id", "yes"),
-                "if_add_node_summary": legacy_config.get("if_add_node_summary", "no"),
-                "if_add_doc_description": legacy_config.get("if_add_doc_description", "yes"),
-                "if_add_node_text": legacy_config.get("if_add_node_text", "no")
-            },
-            "structure_extractor": {
-                "max_token_num_each_node": legacy_config.get("max_token_num_each_node", 20000)
-            }
+            section: {key: legacy_config.get(key, _DEFAULTS[section][key]) for key in keys}
+            for section, keys in _LEGACY_KEYS.items()
         }
         
-        output_file = output_path or str(Path(legacy_config_path).with_name("config_new.yaml"))
+        output_file = output_path or os.path.join(os.path.dirname(os.fspath(legacy_config_path)), "config_new.yaml")
         with open(output_file, 'w') as f:
-            yaml.dump(new_config, f, default_flow_style=False, indent=2)
+            yaml.dump(new_config, f, Dumper=_Dumper, default_flow_style=False, indent=2)
         
         return output_file
@@ -3,13 +3,83 @@ Configuration schema validation for PageIndex Agent
 Provides type-safe configuration validation with sensible defaults
 """
 
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Tuple
+from collections import OrderedDict
 from dataclasses import dataclass, field
 import re
+import threading
+import orjson
 from core.exceptions import PageIndexError
 
 
-@dataclass
+# Per-section field checks: (field, kind, bounds or choices, error message).
+# Numeric bounds are inclusive, None leaves that side open
+_FieldSpec = Tuple[str, str, Any, str]
+
+_FIELD_SPECS: Dict[str, Tuple[_FieldSpec, ...]] = {
+    "global": (
+        ("model", "str", None, "Model must be a non-empty string"),
+        ("log_dir", "str", None, "Log directory must be a non-empty string"),
+        ("session_timeout", "int", (1, None), "Session timeout must be a positive integer"),
+        ("max_tokens_per_call", "int", (100, None), "Max tokens per call must be >= 100"),
+        ("retry_attempts", "int", (1, 10), "Retry attempts must be between 1 and 10"),
+        ("timeout_seconds", "int", (1, None), "Timeout seconds must be a positive integer"),
+        ("pages_format", "choice", ("json", "binary"), "Pages format must be either 'json' or 'binary'"),
+        ("max_log_entries", "int", (5, None), "Max log entries must be >= 5"),
+        ("max_checkpoint_deltas", "int", (0, None), "Max checkpoint deltas must be >= 0"),
+    ),
+    "pdf_parser": (
+        ("pdf_parser", "choice", ("PyMuPDF", "PyPDF2"), "PDF parser must be either 'PyMuPDF' or 'PyPDF2'"),
+        ("max_file_size_mb", "int", (1, None), "Max file size must be a positive integer"),
+    ),
+    "toc_detector": (
+        ("toc_check_page_num", "int", (1, None), "TOC check page number must be a positive integer"),
+    ),
+    "structure_extractor": (
+        ("max_token_num_each_node", "int", (1000, 50000), "Max token number each node must be between 1000 and 50000"),
+        ("max_retries", "int", (1, 5), "Max retries must be between 1 and 5"),
+    ),
+    "structure_verifier": (
+        ("max_fix_attempts", "int", (1, 5), "Max fix attempts must be between 1 and 5"),
+        ("accuracy_threshold", "float", (0.0, 1.0), "Accuracy threshold must be between 0.0 and 1.0"),
+    ),
+    "structure_processor": (
+        ("max_page_num_each_node", "int", (1, 50), "Max page number each node must be between 1 and 50"),
+        ("max_token_num_each_node", "int", (1000, 50000), "Max token number each node must be between 1000 and 50000"),
+        ("enable_batch_processing", "bool", None, "enable_batch_processing must be a boolean"),
+        ("enable_streaming", "bool", None, "enable_streaming must be a boolean"),
+        ("if_add_node_id", "choice", ("yes", "no"), "if_add_node_id must be either 'yes' or 'no'"),
+        ("if_add_node_summary", "choice", ("yes", "no"), "if_add_node_summary must be either 'yes' or 'no'"),
+        ("if_add_doc_description", "choice", ("yes", "no"), "if_add_doc_description must be either 'yes' or 'no'"),
+        ("if_add_node_text", "choice", ("yes", "no"), "if_add_node_text must be either 'yes' or 'no'"),
+    ),
+}
+
+_NUMERIC_KINDS = {"int": int, "float": float}
+
+
+def _check_fields(instance: Any, specs: Tuple[_FieldSpec, ...]) -> None:
+    """Run a section's field checks, raising on the first failure"""
+    for name, kind, arg, message in specs:
+        value = getattr(instance, name)
+        if kind == "choice":
+            valid = value in arg
+        elif kind == "str":
+            valid = isinstance(value, str) and bool(value.strip())
+        elif kind == "bool":
+            valid = isinstance(value, bool)
+        else:
+            low, high = arg
+            valid = (
+                isinstance(value, _NUMERIC_KINDS[kind])
+                and (low is None or value >= low)
+                and (high is None or value <= high)
+            )
+        if not valid:
+            raise PageIndexError(message)
+
+
+@dataclass(slots=True)
 class GlobalConfig:
     """Global configuration settings"""
     model: str = "gpt-4.1-mini"
@@ -18,24 +88,16 @@ class GlobalConfig:
     max_tokens_per_call: int = 4000
     retry_attempts: int = 3
     timeout_seconds: int = 30
+    pages_format: str = "json"  # or "binary"
+    max_log_entries: int = 1000
+    max_checkpoint_deltas: int = 0  # 0 rewrites the full checkpoint every save
 
     def validate(self) -> None:
         """Validate global configuration"""
-        if not isinstance(self.model, str) or not self.model.strip():
-            raise PageIndexError("Model must be a non-empty string")
-        if not isinstance(self.log_dir, str) or not self.log_dir.strip():
-            raise PageIndexError("Log directory must be a non-empty string")
-        if not isinstance(self.session_timeout, int) or self.session_timeout <= 0:
-            raise PageIndexError("Session timeout must be a positive integer")
-        if not isinstance(self.max_tokens_per_call, int) or self.max_tokens_per_call < 100:
-            raise PageIndexError("Max tokens per call must be >= 100")
-        if not isinstance(self.retry_attempts, int) or not 1 <= self.retry_attempts <= 10:
-            raise PageIndexError("Retry attempts must be between 1 and 10")
-        if not isinstance(self.timeout_seconds, int) or self.timeout_seconds <= 0:
-            raise PageIndexError("Timeout seconds must be a positive integer")
-
-
-@dataclass
+        _check_fields(self, _FIELD_SPECS["global"])
+
+
+@dataclass(slots=True)
 class PDFParserConfig:
     """PDF parser configuration"""
     pdf_parser: str = "PyMuPDF"
@@ -43,24 +105,20 @@ class PDFParserConfig:
 
     def validate(self) -> None:
         """Validate PDF parser configuration"""
-        if self.pdf_parser not in ["PyMuPDF", "PyPDF2"]:
-            raise PageIndexError("PDF parser must be either 'PyMuPDF' or 'PyPDF2'")
-        if not isinstance(self.max_file_size_mb, int) or self.max_file_size_mb <= 0:
-            raise PageIndexError("Max file size must be a positive integer")
+        _check_fields(self, _FIELD_SPECS["pdf_parser"])
 
 
-@dataclass
+@dataclass(slots=True)
 class TOCDetectorConfig:
     """TOC detector configuration"""
     toc_check_page_num: int = 20
 
     def validate(self) -> None:
         """Validate TOC detector configuration"""
-        if not isinstance(self.toc_check_page_num, int) or self.toc_check_page_num <= 0:
-            raise PageIndexError("TOC check page number must be a positive integer")
+        _check_fields(self, _FIELD_SPECS["toc_detector"])
 
 
-@dataclass
+@dataclass(slots=True)
 class StructureExtractorConfig:
     """Structure extractor configuration"""
     max_token_num_each_node: int = 20000
@@ -68,13 +126,10 @@ class StructureExtractorConfig:
 
     def validate(self) -> None:
         """Validate structure extractor configuration"""
-        if not isinstance(self.max_token_num_each_node, int) or not 1000 <= self.max_token_num_each_node <= 50000:
-            raise PageIndexError("Max token number each node must be between 1000 and 50000")
-        if not isinstance(self.max_retries, int) or not 1 <= self.max_retries <= 5:
-            raise PageIndexError("Max retries must be between 1 and 5")
+        _check_fields(self, _FIELD_SPECS["structure_extractor"])
 
 
-@dataclass
+@dataclass(slots=True)
 class StructureVerifierConfig:
     """Structure verifier configuration"""
     max_fix_attempts: int = 3
@@ -82,13 +137,10 @@ class StructureVerifierConfig:
 
     def validate(self) -> None:
         """Validate structure verifier configuration"""
-        if not isinstance(self.max_fix_attempts, int) or not 1 <= self.max_fix_attempts <= 5:
-            raise PageIndexError("Max fix attempts must be between 1 and 5")
-        if not isinstance(self.accuracy_threshold, float) or not 0.0 <= self.accuracy_threshold <= 1.0:
-            raise PageIndexError("Accuracy threshold must be between 0.0 and 1.0")
+        _check_fields(self, _FIELD_SPECS["structure_verifier"])
 
 
-@dataclass
+@dataclass(slots=True)
 class StructureProcessorConfig:
     """Structure processor configuration"""
     max_page_num_each_node: int = 10
@@ -102,25 +154,10 @@ class StructureProcessorConfig:
 
     def validate(self) -> None:
         """Validate structure processor configuration"""
-        if not isinstance(self.max_page_num_each_node, int) or not 1 <= self.max_page_num_each_node <= 50:
-            raise PageIndexError("Max page number each node must be between 1 and 50")
-        if not isinstance(self.max_token_num_each_node, int) or not 1000 <= self.max_token_num_each_node <= 50000:
-            raise PageIndexError("Max token number each node must be between 1000 and 50000")
-        
-        bool_fields = ["enable_batch_processing", "enable_streaming"]
-        for field_name in bool_fields:
-            value = getattr(self, field_name)
-            if not isinstance(value, bool):
-                raise PageIndexError(f"{field_name} must be a boolean")
-        
-        string_bool_fields = ["if_add_node_id", "if_add_node_summary", "if_add_doc_description", "if_add_node_text"]
-        for field_name in string_bool_fields:
-            value = getattr(self, field_name)
-            if value not in ["yes", "no"]:
-                raise PageIndexError(f"{field_name} must be either 'yes' or 'no'")
+        _check_fields(self, _FIELD_SPECS["structure_processor"])
 
 
-@dataclass
+@dataclass(slots=True)
 class PageIndexConfig:
     """Complete PageIndex configuration with validation"""
     global_config: GlobalConfig = field(default_factory=GlobalConfig)
@@ -143,29 +180,98 @@ class PageIndexConfig:
     def from_dict(cls, config_dict: Dict[str, Any]) -> 'PageIndexConfig':
         """Create validated configuration from dictionary"""
         try:
-            global_config = GlobalConfig(**config_dict.get('global', {}))
-            pdf_parser = PDFParserConfig(**config_dict.get('pdf_parser', {}))
-            toc_detector = TOCDetectorConfig(**config_dict.get('toc_detector', {}))
-            structure_extractor = StructureExtractorConfig(**config_dict.get('structure_extractor', {}))
-            structure_verifier = StructureVerifierConfig(**config_dict.get('structure_verifier', {}))
-            structure_processor = StructureProcessorConfig(**config_dict.get('structure_processor', {}))
-            
-            config = cls(
-                global_config=global_config,
-                pdf_parser=pdf_parser,
-                toc_detector=toc_detector,
-                structure_extractor=structure_extractor,
-                structure_verifier=structure_verifier,
-                structure_processor=structure_processor
-            )
-            
-            config.validate()
-            return config
+            memo_key = _validation_key(config_dict)
+            check = memo_key is None or not _was_validated(memo_key)
+            sections = {
+                field_name: build(config_dict.get(key, {}), check)
+                for key, field_name, build in _SECTION_BUILDERS
+            }
+            config = cls(**sections)
             
         except TypeError as e:
             raise PageIndexError(f"Configuration validation failed: {str(e)}")
         except Exception as e:
             raise PageIndexError(f"Invalid configuration: {str(e)}")
+        
+        if check and memo_key is not None:
+            _remember_validated(memo_key)
+        return config
+
+    @classmethod
+    def from_dict_unchecked(cls, config_dict: Dict[str, Any]) -> 'PageIndexConfig':
+        """Rebuild a configuration from asdict() output of an already validated instance
+        
+        Sections are keyed by field name (``global_config`` rather than
+        ``global``) and validation is skipped.
+        """
+        return cls(**{
+            field_name: build(config_dict.get(field_name, {}), False)
+            for _, field_name, build in _SECTION_BUILDERS
+        })
+
+
+# Serialized config dicts that have recently passed validation, least recently
+# used first. Bounded so per-call overrides cannot grow it without limit.
+_VALIDATED_KEYS_SIZE = 128
+_validated_keys: "OrderedDict[bytes, None]" = OrderedDict()
+_validated_keys_lock = threading.Lock()
+
+
+def _was_validated(memo_key: bytes) -> bool:
+    """Whether a serialized config dict is known to be valid, marking it recently used"""
+    with _validated_keys_lock:
+        if memo_key not in _validated_keys:
+            return False
+        _validated_keys.move_to_end(memo_key)
+        return True
+
+
+def _remember_validated(memo_key: bytes) -> None:
+    """Record a serialized config dict as valid, evicting the least recently used beyond the size"""
+    with _validated_keys_lock:
+        _validated_keys[memo_key] = None
+        _validated_keys.move_to_end(memo_key)
+        if len(_validated_keys) > _VALIDATED_KEYS_SIZE:
+            _validated_keys.popitem(last=False)
+
+
+def _validation_key(config_dict: Dict[str, Any]) -> Optional[bytes]:
+    """Canonical serialization of a config dict, or None when it cannot be serialized"""
+    try:
+        return orjson.dumps(config_dict, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return None
+
+
+def _section_builder(section_cls: type) -> Callable[[Dict[str, Any], bool], Any]:
+    """Compile a constructor that builds and optionally validates one config section"""
+    validate = section_cls.validate
+    
+    def build(data: Dict[str, Any], check: bool = True) -> Any:
+        instance = section_cls(**data)
+        if check:
+            validate(instance)
+        return instance
+    
+    return build
+
+
+# (YAML section, PageIndexConfig field, builder), resolved once at import
+_SECTION_BUILDERS: Tuple[Tuple[str, str, Callable[[Dict[str, Any], bool], Any]], ...] = tuple(
+    (key, field_name, _section_builder(section_cls))
+    for key, field_name, section_cls in (
+        ("global", "global_config", GlobalConfig),
+        ("pdf_parser", "pdf_parser", PDFParserConfig),
+        ("toc_detector", "toc_detector", TOCDetectorConfig),
+        ("structure_extractor", "structure_extractor", StructureExtractorConfig),
+        ("structure_verifier", "structure_verifier", StructureVerifierConfig),
+        ("structure_processor", "structure_processor", StructureProcessorConfig),
+    )
+)
+
+
+# Anchored with \Z so a trailing newline is rejected too
+_PATH_RE = re.compile(r'^[\w\-./]+\Z')
 
 
 def validate_config_path(path: str) -> str:
@@ -174,22 +280,32 @@ def validate_config_path(path: str) -> str:
         raise PageIndexError("Configuration path must be a string")
     
     # Basic path validation
-    if not re.match(r'^[\w\-./]+$', path):
+    if not _PATH_RE.match(path):
         raise PageIndexError("Configuration path contains invalid characters")
     
     return path
 
 
 def merge_configs(base_config: Dict[str, Any], user_overrides: Dict[str, Any]) -> Dict[str, Any]:
-    """Merge base configuration with user overrides"""
+    """Merge base configuration with user overrides
+    
+    Nested dicts are copied only along the paths the overrides touch, so
+    neither input is mutated.
+    """
     merged = base_config.copy()
+    stack = [(merged, user_overrides)]
     
-    def deep_merge(base: Dict[str, Any], overrides: Dict[str, Any]) -> None:
+    while stack:
+        base, overrides = stack.pop()
         for key, value in overrides.items():
-            if key in base and isinstance(base[key], dict) and isinstance(value, dict):
-                deep_merge(base[key], value)
-            else:
+            current = base.get(key)
+            if not (isinstance(current, dict) and isinstance(value, dict)):
                 base[key] = value
+            elif current.keys() & value.keys():
+                base[key] = current = current.copy()
+                stack.append((current, value))
+            else:
+                # Disjoint keys need no deeper walk
+                base[key] = {**current, **value}
     
-    deep_merge(merged, user_overrides)
     return merged
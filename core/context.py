@@ -1,11 +1,90 @@
-import json
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import time
 import uuid
+from collections import deque
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import BinaryIO, Deque, List, Dict, Any, Optional, Tuple
+import orjson
+from dataclasses import dataclass, asdict, fields
 from datetime import datetime
 from core.config_schema import PageIndexConfig
 
+# Section names of a serialized PageIndexConfig
+_CONFIG_SECTIONS = frozenset(f.name for f in fields(PageIndexConfig))
+
+# Binary pages file: page count, then (text byte length, token count) + UTF-8 text per page
+_PAGE_COUNT = struct.Struct("<I")
+_PAGE_HEADER = struct.Struct("<II")
+
+def _write_pages(f: BinaryIO, pages: List[tuple]) -> None:
+    """Write (text, token_count) pages in the binary pages format, one record at a time"""
+    f.write(_PAGE_COUNT.pack(len(pages)))
+    for text, token_count in pages:
+        encoded = text.encode('utf-8')
+        f.write(_PAGE_HEADER.pack(len(encoded), token_count))
+        f.write(encoded)
+
+def _unpack_pages(data: memoryview) -> List[tuple]:
+    """Decode the binary pages format back into (text, token_count) tuples"""
+    view = memoryview(data)
+    (count,) = _PAGE_COUNT.unpack_from(view, 0)
+    offset = _PAGE_COUNT.size
+    pages = []
+    for _ in range(count):
+        length, token_count = _PAGE_HEADER.unpack_from(view, offset)
+        offset += _PAGE_HEADER.size
+        pages.append((str(view[offset:offset + length], 'utf-8'), token_count))
+        offset += length
+    return pages
+
+# Checkpoint fields a delta record carries only when they changed; the
+# remaining state fields are small and carried by every record
+_DELTA_FIELDS = ("pdf_metadata", "toc_info", "structure_raw", "structure_verified", "structure_final")
+_DELTA_SUFFIX = ".delta"
+
+# Checkpoint path -> (base file signature, delta records since, field digests as
+# last written). Module-level because each tool gets a context restored by from_dict
+_checkpoint_state: Dict[str, Tuple[Tuple[int, int], int, Dict[str, bytes]]] = {}
+
+def _field_digests(context_dict: Dict[str, Any]) -> Dict[str, bytes]:
+    """Digest of each delta-tracked field's serialized form"""
+    return {
+        name: hashlib.blake2b(orjson.dumps(context_dict[name], option=orjson.OPT_NON_STR_KEYS), digest_size=16).digest()
+        for name in _DELTA_FIELDS
+    }
+
+def checkpoint_delta_path(checkpoint_path: Path) -> Path:
+    """Delta log that holds changes written after the given checkpoint"""
+    return Path(checkpoint_path).with_suffix(_DELTA_SUFFIX)
+
+def load_checkpoint(checkpoint_path: Path) -> Dict[str, Any]:
+    """Read a checkpoint and replay any delta records appended after it"""
+    with open(checkpoint_path, 'rb') as f:
+        checkpoint = orjson.loads(f.read())
+    try:
+        with open(checkpoint_delta_path(checkpoint_path), 'rb') as f:
+            for line in f:
+                try:
+                    checkpoint.update(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    break  # torn final record from an interrupted write
+    except FileNotFoundError:
+        pass
+    return checkpoint
+
+def _format_log(log: Deque[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Copy of a processing log with epoch timestamps rendered as ISO 8601"""
+    return [
+        {**step, "timestamp": datetime.fromtimestamp(step["timestamp"]).isoformat()}
+        if isinstance(step.get("timestamp"), float) else step
+        for step in log
+    ]
+
 @dataclass
 class PageIndexContext:
     """Context object that carries state through the PageIndex processing pipeline"""
@@ -18,7 +97,7 @@ class PageIndexContext:
     structure_raw: List[Dict[str, Any]]
     structure_verified: List[Dict[str, Any]]
     structure_final: Dict[str, Any]
-    processing_log: List[Dict[str, Any]]
+    processing_log: Deque[Dict[str, Any]]  # Bounded by global.max_log_entries
     current_step: str
     
     def __init__(self, config: PageIndexConfig):
@@ -30,15 +109,21 @@ class PageIndexContext:
         self.structure_raw = []
         self.structure_verified = []
         self.structure_final = {}
-        self.processing_log = []
+        self.processing_log = deque(maxlen=config.global_config.max_log_entries)
         self.current_step = "initialized"
+        
+        # (checkpoint path, pages file signature) last embedded in a checkpoint
+        self._pages_checkpointed: Optional[Tuple[str, Tuple[int, int]]] = None
+        
+        # (config, asdict(config)) from the last serialization; configs are not mutated after load
+        self._config_dict: Optional[Tuple[PageIndexConfig, Dict[str, Any]]] = None
     
     def log_step(self, tool_name: str, status: str, details: Dict[str, Any] = None):
         """Add processing step to log"""
         step = {
             "tool": tool_name,
             "status": status,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": time.time(),  # formatted when serialized
             "details": details or {}
         }
         self.processing_log.append(step)
@@ -46,58 +131,158 @@ class PageIndexContext:
     
     def save_pages(self, pages: List[tuple], log_dir: Path):
         """Save pages data to file and store reference"""
-        pages_path = log_dir / f"{self.session_id}_pages.json"
-        with open(pages_path, 'w', encoding='utf-8') as f:
-            json.dump(pages, f, indent=2)
+        if self.config.global_config.pages_format == "binary":
+            pages_path = log_dir / f"{self.session_id}_pages.bin"
+            # Buffered per-page writes; the whole encoded corpus is never held at once
+            with open(pages_path, 'wb') as f:
+                _write_pages(f, pages)
+        else:
+            pages_path = log_dir / f"{self.session_id}_pages.json"
+            with open(pages_path, 'wb') as f:
+                # Machine-read only: compact, with non-ASCII text left unescaped
+                f.write(orjson.dumps(pages))
         self.pages_file = str(pages_path)
     
     def load_pages(self) -> List[tuple]:
         """Load pages data from file"""
         if not self.pages_file:
             return []
-        with open(self.pages_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # Format follows the file, so contexts restored under another config still load
+        decode = _unpack_pages if self.pages_file.endswith(".bin") else orjson.loads
+        
+        # Decode straight from the mapped file rather than a bytes copy of it
+        with open(self.pages_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                memoryview(mapped) as view:
+            return decode(view)
     
     def save_checkpoint(self, log_dir: Path, include_pages: bool = False):
         """Save current context state for diagnostics"""
         checkpoint_path = log_dir / f"{self.session_id}_checkpoint.json"
-        context_dict = asdict(self)
+        context_dict = self._to_serializable_dict()
+        context_dict["processing_log"] = _format_log(self.processing_log)
+        
+        # Page snapshots always go to a full checkpoint; other saves may append a delta
+        if not include_pages and self._append_checkpoint_delta(checkpoint_path, context_dict):
+            return
+        
+        self._write_checkpoint(checkpoint_path, context_dict, include_pages)
         
-        # Optionally include pages data in checkpoint for debugging
+        # The new base supersedes any delta records written against the old one
+        try:
+            os.remove(checkpoint_delta_path(checkpoint_path))
+        except FileNotFoundError:
+            pass
+        if self.config.global_config.max_checkpoint_deltas:
+            stat = os.stat(checkpoint_path)
+            _checkpoint_state[str(checkpoint_path)] = (
+                (stat.st_mtime_ns, stat.st_size), 0, _field_digests(context_dict)
+            )
+    
+    def _append_checkpoint_delta(self, checkpoint_path: Path, context_dict: Dict[str, Any]) -> bool:
+        """Append changed fields to the delta log; False when a full checkpoint is due"""
+        max_deltas = self.config.global_config.max_checkpoint_deltas
+        state = _checkpoint_state.get(str(checkpoint_path))
+        if not max_deltas or state is None:
+            return False
+        
+        # Compact once the log is long, or if the base changed underneath us
+        signature, delta_count, digests = state
+        try:
+            stat = os.stat(checkpoint_path)
+        except OSError:
+            return False
+        if delta_count >= max_deltas or (stat.st_mtime_ns, stat.st_size) != signature:
+            return False
+        
+        new_digests = _field_digests(context_dict)
+        record = {name: context_dict[name] for name in _DELTA_FIELDS if new_digests[name] != digests[name]}
+        record["pages_file"] = context_dict["pages_file"]
+        record["processing_log"] = context_dict["processing_log"]
+        record["current_step"] = context_dict["current_step"]
+        
+        with open(checkpoint_delta_path(checkpoint_path), 'ab') as f:
+            f.write(orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS) + b"\n")
+        _checkpoint_state[str(checkpoint_path)] = (signature, delta_count + 1, new_digests)
+        return True
+    
+    def _write_checkpoint(self, checkpoint_path: Path, context_dict: Dict[str, Any], include_pages: bool):
+        """Write the full checkpoint file, optionally with pages data"""
+        # Optionally include pages data in checkpoint for debugging. Pages are
+        # embedded once; later saves point at the unchanged pages file instead
+        embed_pages = False
         if include_pages and self.pages_file:
-            context_dict['pages_data'] = self.load_pages()
-            
-        with open(checkpoint_path, 'w', encoding='utf-8') as f:
-            json.dump(context_dict, f, indent=2)
+            stat = os.stat(self.pages_file)
+            pages_checkpoint = (str(checkpoint_path), (stat.st_mtime_ns, stat.st_size))
+            if self._pages_checkpointed == pages_checkpoint:
+                context_dict['pages_ref'] = self.pages_file
+            elif self.pages_file.endswith(".bin"):
+                context_dict['pages_data'] = self.load_pages()
+                self._pages_checkpointed = pages_checkpoint
+            else:
+                embed_pages = True
+        
+        encoded = orjson.dumps(context_dict, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        
+        # Write beside the checkpoint and swap it in, so readers never see a partial file
+        tmp_path = checkpoint_path.with_suffix(".tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            if not embed_pages:
+                f.write(encoded)
+            else:
+                # The pages file is already JSON, so splice its bytes in as the
+                # last member rather than parsing and re-encoding every page
+                f.write(encoded[:-2])
+                f.write(b',\n  "pages_data": ')
+                with open(self.pages_file, 'rb') as pages:
+                    shutil.copyfileobj(pages, f)
+                f.write(b'\n}')
+        os.replace(tmp_path, checkpoint_path)
+        
+        if embed_pages:
+            self._pages_checkpointed = pages_checkpoint
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Serialize context for Agent SDK (excluding large data)"""
+    def _to_serializable_dict(self) -> Dict[str, Any]:
+        """Shallow field dict for serialization; nested state is shared, not copied"""
+        if self._config_dict is None or self._config_dict[0] is not self.config:
+            self._config_dict = (self.config, asdict(self.config))
+        
         return {
             "session_id": self.session_id,
-            "config": asdict(self.config),
+            "config": self._config_dict[1],
             "pdf_metadata": self.pdf_metadata,
             "pages_file": self.pages_file,
             "toc_info": self.toc_info,
             "structure_raw": self.structure_raw,
             "structure_verified": self.structure_verified,
             "structure_final": self.structure_final,
-            "processing_log": self.processing_log[-5:],  # Last 5 steps only
+            "processing_log": self.processing_log,
             "current_step": self.current_step
         }
     
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize context for Agent SDK (excluding large data)"""
+        context_dict = self._to_serializable_dict()
+        # Last 5 steps only, read from the right end rather than skipping the rest
+        context_dict["processing_log"] = list(islice(reversed(self.processing_log), 5))[::-1]
+        return context_dict
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'PageIndexContext':
         """Create context from dictionary"""
-        from core.config_schema import PageIndexConfig
-        
-        # Handle both old dict format and new object format
+        # Handle both old dict format and new object format. Dicts come from
+        # to_dict() of a context whose config was validated when loaded
         config_data = data.get('config', {})
         if isinstance(config_data, dict):
-            config = PageIndexConfig.from_dict(config_data)
+            config = PageIndexConfig.from_dict_unchecked(config_data)
         else:
             config = config_data
             
         context = cls(config)
+        if isinstance(config_data, dict) and config_data.keys() == _CONFIG_SECTIONS:
+            # Complete asdict() output, so reuse it rather than serializing again
+            context._config_dict = (config, config_data)
         
         # Restore state from dictionary
         context.session_id = data.get('session_id', str(uuid.uuid4()))
@@ -107,7 +292,7 @@ class PageIndexContext:
         context.structure_raw = data.get('structure_raw', [])
         context.structure_verified = data.get('structure_verified', [])
         context.structure_final = data.get('structure_final', {})
-        context.processing_log = data.get('processing_log', [])
+        context.processing_log.extend(data.get('processing_log', []))
         context.current_step = data.get('current_step', "initialized")
         
         return context
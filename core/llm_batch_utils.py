@@ -2,13 +2,32 @@
 LLM Batching utilities for efficient token usage and reduced API calls
 """
 
-import openai
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import json
+import os
+import orjson
+from typing import TYPE_CHECKING, AsyncIterator, List, Dict, Any, Optional
 from dataclasses import dataclass
-from core.utils import count_tokens
+from core import tokens
+from core.cache_utils import cache_key, get_response_cache
+from core.async_utils import openai_client
 
+if TYPE_CHECKING:
+    import openai
 
-@dataclass
+
+# Batch prompts delimit items with a §id§ line instead of labelled fields
+_ITEM_MARKER_NOTE = "Each item starts with its id on its own line between § markers."
+_RESULTS_FORMAT = 'JSON format: {"results": [{"id": "<id>", "result": {...}}]}\n\n'
+
+
+def _operation_header(instruction: str) -> str:
+    """Static prompt header for a batched per-item operation"""
+    return f"{instruction} {_ITEM_MARKER_NOTE}\n{_RESULTS_FORMAT}"
+
+
+@dataclass(slots=True)
 class BatchItem:
     """Single item in a batch request"""
     id: str
@@ -16,7 +35,7 @@ class BatchItem:
     metadata: Optional[Dict[str, Any]] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class BatchResult:
     """Result from a batch request"""
     id: str
@@ -27,14 +46,92 @@ class BatchResult:
 class LLMBatcher:
     """Efficient LLM batching for similar operations with token awareness"""
     
-    def __init__(self, model: str = "gpt-4", max_tokens: int = 120000):
+    # Prompt headers per operation type, expanded once when the class is created
+    _EXTRACTION_HEADERS = {
+        operation: _operation_header(instruction) for operation, instruction in {
+            "toc_transform": "Transform the following raw TOC content into structured JSON format.",
+            "physical_indices": "Extract physical page indices for the following TOC items.",
+            "content_matching": "Match TOC items to content sections."
+        }.items()
+    }
+    _TOC_HEADERS = {
+        operation: _operation_header(instruction) for operation, instruction in {
+            "transform_toc": "Transform the following TOC content items into structured JSON format.",
+            "extract_indices": "Extract physical indices for the following TOC items from document content.",
+            "match_content": "Match the following TOC items to content sections and add physical indices."
+        }.items()
+    }
+    _DEFAULT_HEADER = _operation_header("Process the following items.")
+    _SUMMARY_HEADER = (
+        "You are given multiple document sections to summarize. " + _ITEM_MARKER_NOTE
+        + " For each section, describe the main points covered.\n"
+        + 'JSON format: {"summaries": [{"id": "<id>", "summary": "<main points>"}]}\n\n'
+    )
+    _SUMMARY_FOOTER = "\nReturn only the JSON response with summaries for all sections."
+    
+    def __init__(self, model: str = "gpt-4", max_tokens: int = 120000,
+                 client: Optional["openai.AsyncOpenAI"] = None, dedupe: bool = True):
         self.model = model
-        self.client = openai.AsyncOpenAI()
+        self.dedupe = dedupe  # Summarize identical item contents once
+        self.client = client  # Injected client; otherwise each operation opens and closes its own
         self.max_tokens = max_tokens  # Conservative limit for context window
+        self.cache = get_response_cache()  # None unless PAGEINDEX_LLM_CACHE_DIR is set
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Parallel batch requests
+    
+    def _response_cache_key(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Response cache key for a temperature=0 request, or None when caching is off"""
+        if self.cache is None:
+            return None
+        return cache_key({"model": self.model, "messages": messages, "temperature": 0})
+    
+    async def _cached_chat(self, prompt: str, client: "openai.AsyncOpenAI") -> str:
+        """Run a temperature=0 completion, answering repeats from the response cache"""
+        messages = [{"role": "user", "content": prompt}]
+        key = self._response_cache_key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        response = await client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+        )
+        content = response.choices[0].message.content
+        
+        if key is not None and content is not None:
+            self.cache.set(key, content)
+        return content
+    
+    async def _stream_chat(self, prompt: str, client: "openai.AsyncOpenAI") -> AsyncIterator[str]:
+        """Stream a temperature=0 completion as text deltas; a cached response arrives whole"""
+        messages = [{"role": "user", "content": prompt}]
+        key = self._response_cache_key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        
+        stream = await client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0,
+            stream=True,
+        )
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+        
+        if key is not None and parts:
+            self.cache.set(key, "".join(parts))
     
     async def batch_summarize(self, items: List[BatchItem]) -> List[BatchResult]:
         """
-        Batch multiple text summarization requests into a single LLM call
+        Batch multiple text summarization requests into as few LLM calls as fit the token limit
         
         Args:
             items: List of BatchItem objects with text to summarize
@@ -42,56 +139,107 @@ class LLMBatcher:
         Returns:
             List of BatchResult objects with summaries
         """
+        results = {result.id: result async for result in self.iter_batch_summarize(items)}
+        return [results[item.id] for item in items]
+    
+    async def iter_batch_summarize(self, items: List[BatchItem]) -> AsyncIterator[BatchResult]:
+        """
+        Streaming form of batch_summarize that yields each summary as soon as it completes
+        
+        Results come in response order. Items a response omits or garbles are
+        yielded, with errors, once that response is complete. Items over the
+        token limit are split into batches that stream concurrently.
+        """
+        # Send one item per distinct content; the rest share its result
+        first_by_digest: Dict[str, BatchItem] = {}
+        duplicates: Dict[str, List[str]] = {}
+        unique = []
+        for item in items:
+            first = first_by_digest.setdefault(_text_digest(item.content), item) if self.dedupe else item
+            if first is item:
+                unique.append(item)
+            else:
+                duplicates.setdefault(first.id, []).append(item.id)
+        
+        if not unique:
+            return
+        
+        batches = self._split_items_by_token_limit(unique, self._SUMMARY_HEADER + self._SUMMARY_FOOTER)
+        
+        async with openai_client(self.client) as client:
+            if len(batches) == 1:
+                results = self._iter_summaries(batches[0], client)
+            else:
+                results = self._iter_concurrent_summaries(batches, client)
+            
+            async for result in results:
+                yield result
+                for duplicate_id in duplicates.get(result.id, ()):
+                    yield BatchResult(id=duplicate_id, result=result.result, error=result.error)
+    
+    async def _iter_concurrent_summaries(self, batches: List[List[BatchItem]],
+                                         client: "openai.AsyncOpenAI") -> AsyncIterator[BatchResult]:
+        """Stream several summary batches within the concurrency limit, merging results as they arrive"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queue: "asyncio.Queue[Optional[BatchResult]]" = asyncio.Queue()
+        
+        async def pump(batch: List[BatchItem]) -> None:
+            try:
+                async with semaphore:
+                    async for result in self._iter_summaries(batch, client):
+                        queue.put_nowait(result)
+            finally:
+                queue.put_nowait(None)  # batch finished
+        
+        tasks = [asyncio.create_task(pump(batch)) for batch in batches]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                result = await queue.get()
+                if result is None:
+                    remaining -= 1
+                else:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _iter_summaries(self, items: List[BatchItem], client: "openai.AsyncOpenAI") -> AsyncIterator[BatchResult]:
+        """Stream one summarize request for the items, yielding results as they complete"""
         if not items:
-            return []
+            return
         
         # Build batch prompt with all items
         batch_prompt = self._build_summary_batch_prompt(items)
+        pending = {item.id: item for item in items}
+        scanner = _SummaryScanner()
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": batch_prompt}],
-                temperature=0,
-            )
-            
-            # Parse batch response
-            return self._parse_summary_batch_response(response.choices[0].message.content, items)
-            
+            async for delta in self._stream_chat(batch_prompt, client):
+                for entry in scanner.feed(delta):
+                    summary_id = entry.get("id") if isinstance(entry, dict) else None
+                    summary = entry.get("summary") if isinstance(entry, dict) else None
+                    if summary_id in pending and isinstance(summary, str) and summary.strip():
+                        del pending[summary_id]
+                        yield BatchResult(id=summary_id, result=summary)
         except Exception as e:
-            # Return error results for all items
-            return [BatchResult(id=item.id, result="", error=str(e)) for item in items]
+            # Return error results for all remaining items
+            for item in pending.values():
+                yield BatchResult(id=item.id, result="", error=str(e))
+            return
+        
+        # Whatever the incremental scan missed gets the lenient full-response parse
+        if pending:
+            for result in self._parse_summary_batch_response(scanner.text, list(pending.values())):
+                yield result
     
     def _build_summary_batch_prompt(self, items: List[BatchItem]) -> str:
         """Build a single prompt for multiple summarization tasks"""
-        
-        prompt = """You are given multiple document sections to summarize. For each section, generate a description of the main points covered.
-
-Return your response in the following JSON format:
-{
-  "summaries": [
-    {"id": "item_1", "summary": "description of main points"},
-    {"id": "item_2", "summary": "description of main points"},
-    ...
-  ]
-}
-
-Document sections to summarize:
-
-"""
-        
-        for item in items:
-            prompt += f"ID: {item.id}\n"
-            prompt += f"Text: {item.content}\n\n"
-        
-        prompt += "Return only the JSON response with summaries for all sections."
-        
-        return prompt
+        return "".join([self._SUMMARY_HEADER, *map(_format_item, items), self._SUMMARY_FOOTER])
     
     def _parse_summary_batch_response(self, response: str, items: List[BatchItem]) -> List[BatchResult]:
         """Parse batch response and map back to individual results"""
         try:
-            import json
             from core.utils import extract_json
             
             # Try to extract JSON from response using the utility function
@@ -99,7 +247,7 @@ Document sections to summarize:
                 response_data = extract_json(response)
             except:
                 # Fallback to direct JSON parsing
-                response_data = json.loads(response)
+                response_data = orjson.loads(response)
             
             summaries = response_data.get("summaries", [])
             
@@ -107,21 +255,20 @@ Document sections to summarize:
             if not isinstance(summaries, list):
                 raise ValueError("Summaries is not a list")
             
-            # Create mapping from response with validation
-            summary_map = {}
-            for s in summaries:
-                if isinstance(s, dict) and "id" in s and "summary" in s:
-                    summary_map[s["id"]] = s["summary"]
+            # Map summaries for requested ids only; hallucinated ids are dropped
+            id_set = {item.id for item in items}
+            summary_map = {
+                s["id"]: s["summary"] for s in summaries
+                if isinstance(s, dict) and s.get("id") in id_set and isinstance(s.get("summary"), str)
+            }
             
-            # Build results in original order
-            results = []
-            for item in items:
-                if item.id in summary_map and summary_map[item.id].strip():
-                    # Valid summary found
-                    results.append(BatchResult(id=item.id, result=summary_map[item.id]))
-                else:
-                    # No valid summary found - return error to trigger fallback
-                    results.append(BatchResult(id=item.id, result="", error="Summary not found or empty in batch response"))
+            # Build results in original order; a missing or empty summary triggers fallback
+            results = [
+                BatchResult(id=item.id, result=summary_map[item.id])
+                if summary_map.get(item.id, "").strip()
+                else BatchResult(id=item.id, result="", error="Summary not found or empty in batch response")
+                for item in items
+            ]
             
             return results
             
@@ -147,75 +294,74 @@ Document sections to summarize:
         batch_prompt = self._build_extraction_batch_prompt(items, operation_type)
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": batch_prompt}],
-                temperature=0,
-            )
+            async with openai_client(self.client) as client:
+                response = await self._cached_chat(batch_prompt, client)
             
-            return self._parse_extraction_batch_response(response.choices[0].message.content, items)
+            return self._parse_extraction_batch_response(response, items)
             
         except Exception as e:
             return [BatchResult(id=item.id, result="", error=str(e)) for item in items]
     
     def _build_extraction_batch_prompt(self, items: List[BatchItem], operation_type: str) -> str:
         """Build batch prompt for structure extraction operations"""
-        
-        base_prompts = {
-            "toc_transform": "Transform the following raw TOC content into structured JSON format",
-            "physical_indices": "Extract physical page indices for the following TOC items",
-            "content_matching": "Match TOC items to content sections"
-        }
-        
-        prompt = f"{base_prompts.get(operation_type, 'Process the following items')}.\n\n"
-        prompt += "Return your response in JSON format with an array of results:\n"
-        prompt += '{"results": [{"id": "item_1", "result": {...}}, {"id": "item_2", "result": {...}}]}\n\n'
-        
-        for item in items:
-            prompt += f"ID: {item.id}\n"
-            prompt += f"Content: {item.content}\n\n"
-        
-        return prompt
+        header = self._EXTRACTION_HEADERS.get(operation_type, self._DEFAULT_HEADER)
+        return "".join([header, *map(_format_item, items)])
     
     def _parse_extraction_batch_response(self, response: str, items: List[BatchItem]) -> List[BatchResult]:
         """Parse batch extraction response"""
         try:
-            import json
-            
-            response_data = json.loads(response)
+            response_data = orjson.loads(response)
             results_data = response_data.get("results", [])
             
-            # Create mapping from response
-            result_map = {r["id"]: r["result"] for r in results_data}
+            # Map results for requested ids only; anything else the model echoed is dropped
+            id_set = {item.id for item in items}
+            result_map = {r["id"]: r["result"] for r in results_data if r["id"] in id_set}
             
             # Build results in original order
             results = []
             for item in items:
                 result = result_map.get(item.id, {})
-                results.append(BatchResult(id=item.id, result=json.dumps(result)))
+                results.append(BatchResult(id=item.id, result=orjson.dumps(result).decode()))
             
             return results
             
         except Exception as e:
             return [BatchResult(id=item.id, result="", error=f"Parse error: {str(e)}") for item in items]
     
-    def _split_items_by_token_limit(self, items: List[BatchItem], base_prompt: str) -> List[List[BatchItem]]:
-        """Split items into batches that respect token limits"""
+    def _split_items_by_token_limit(self, items: List[BatchItem], base_prompt: str,
+                                    contiguous: bool = False) -> List[List[BatchItem]]:
+        """Split items into batches that respect token limits
+        
+        Items are packed first-fit-decreasing to minimise the number of batches,
+        keeping their original order within each batch. Pass contiguous=True when
+        each batch must be a consecutive run of items, e.g. document chunks.
+        """
         if not items:
             return []
         
+        item_texts = [_format_item(item) for item in items]
+        
+        # Every token covers at least one UTF-8 byte, so byte length is an upper
+        # bound on token count; when that already fits, skip tokenizing entirely
+        if _max_tokens(base_prompt) + sum(map(_max_tokens, item_texts)) <= self.max_tokens:
+            return [list(items)]
+        
+        base_tokens = tokens.count(base_prompt, self.model)
+        item_token_counts = tokens.count_batch(item_texts, self.model)
+        
+        if not contiguous:
+            return _pack_first_fit_decreasing(items, item_token_counts, self.max_tokens - base_tokens)
+        
         batches = []
         current_batch = []
-        current_tokens = count_tokens(base_prompt, self.model)
+        current_tokens = base_tokens
         
-        for item in items:
-            item_tokens = count_tokens(f"ID: {item.id}\nContent: {item.content}\n\n", self.model)
-            
+        for item, item_tokens in zip(items, item_token_counts):
             # If adding this item would exceed limit, start new batch
             if current_tokens + item_tokens > self.max_tokens and current_batch:
                 batches.append(current_batch)
                 current_batch = [item]
-                current_tokens = count_tokens(base_prompt, self.model) + item_tokens
+                current_tokens = base_tokens + item_tokens
             else:
                 current_batch.append(item)
                 current_tokens += item_tokens
@@ -231,55 +377,150 @@ Document sections to summarize:
         if not items:
             return []
         
-        # Define operation-specific prompts
-        operation_prompts = {
-            "transform_toc": "Transform the following TOC content items into structured JSON format.",
-            "extract_indices": "Extract physical indices for the following TOC items from document content.",
-            "match_content": "Match the following TOC items to content sections and add physical indices."
-        }
+        async with openai_client(self.client) as client:
+            return await self._batch_toc_operations(items, operation_type, client)
+    
+    async def _batch_toc_operations(self, items: List[BatchItem], operation_type: str,
+                                    client: "openai.AsyncOpenAI") -> List[BatchResult]:
+        """batch_toc_operations over an open client"""
+        base_prompt = self._TOC_HEADERS.get(operation_type, self._DEFAULT_HEADER)
         
-        base_prompt = operation_prompts.get(operation_type, "Process the following items.")
-        base_prompt += "\n\nReturn response in JSON format: {\"results\": [{\"id\": \"item_1\", \"result\": {...}}]}\n\n"
+        # Requests well under the limit go out whole without tokenizing; if the
+        # API still rejects one as too long, fall back to splitting
+        approx_tokens = (len(base_prompt) + sum(len(item.content) for item in items)) >> 2
+        if approx_tokens < self.max_tokens // 2:
+            import openai
+            
+            try:
+                response = await self._cached_chat("".join([base_prompt, *map(_format_item, items)]), client)
+                return self._parse_extraction_batch_response(response, items)
+            except openai.BadRequestError as e:
+                if e.code != "context_length_exceeded":
+                    return [BatchResult(id=item.id, result="", error=str(e)) for item in items]
+            except Exception as e:
+                return [BatchResult(id=item.id, result="", error=str(e)) for item in items]
         
         # Split items into token-aware batches
         batches = self._split_items_by_token_limit(items, base_prompt)
         
-        all_results = []
-        for batch in batches:
-            try:
-                # Build batch prompt
-                batch_prompt = base_prompt
-                for item in batch:
-                    batch_prompt += f"ID: {item.id}\n"
-                    batch_prompt += f"Content: {item.content}\n\n"
-                
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": batch_prompt}],
-                    temperature=0,
-                )
-                
-                batch_results = self._parse_extraction_batch_response(
-                    response.choices[0].message.content, batch
-                )
-                all_results.extend(batch_results)
-                
-            except Exception as e:
-                # Add error results for this batch
-                error_results = [BatchResult(id=item.id, result="", error=str(e)) for item in batch]
-                all_results.extend(error_results)
+        # Batches are independent, so send them together within the concurrency limit
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        grouped = await asyncio.gather(*(
+            self._run_one_batch(batch, base_prompt, semaphore, client) for batch in batches
+        ))
+        
+        # Packing may interleave items across batches; restore input order
+        position = {id(item): index for index, item in enumerate(items)}
+        ordered = [None] * len(items)
+        for batch, batch_results in zip(batches, grouped):
+            for item, result in zip(batch, batch_results):
+                ordered[position[id(item)]] = result
+        
+        return ordered
+    
+    async def _run_one_batch(self, batch: List[BatchItem], base_prompt: str, semaphore: asyncio.Semaphore,
+                             client: "openai.AsyncOpenAI") -> List[BatchResult]:
+        """Send one token-limited batch of TOC items and parse its results"""
+        try:
+            # Build batch prompt
+            batch_prompt = "".join([base_prompt, *map(_format_item, batch)])
+            
+            async with semaphore:
+                response = await self._cached_chat(batch_prompt, client)
+            
+            return self._parse_extraction_batch_response(response, batch)
+            
+        except Exception as e:
+            # Add error results for this batch
+            return [BatchResult(id=item.id, result="", error=str(e)) for item in batch]
+
+
+class _SummaryScanner:
+    """Pulls complete objects out of a streamed {"summaries": [...]} response as they close"""
+    
+    _decoder = json.JSONDecoder()
+    
+    def __init__(self):
+        self._consumed: List[str] = []
+        self._tail = ""  # text not yet decoded; at most one partial object once in the array
+        self._in_array = False
+    
+    @property
+    def text(self) -> str:
+        """All text fed so far"""
+        return "".join(self._consumed) + self._tail
+    
+    def feed(self, chunk: str) -> List[Any]:
+        """Add streamed text and return the array elements it completed"""
+        self._tail += chunk
+        if not self._in_array:
+            key = self._tail.find('"summaries"')
+            start = self._tail.find("[", key) if key != -1 else -1
+            if start == -1:
+                return []
+            self._consume(start + 1)
+            self._in_array = True
+        elif "}" not in chunk:
+            return []
         
-        return all_results
+        entries = []
+        while True:
+            start = self._tail.find("{")
+            if start == -1:
+                break
+            try:
+                entry, end = self._decoder.raw_decode(self._tail, start)
+            except ValueError:
+                break  # object still open; wait for more text
+            entries.append(entry)
+            self._consume(end)
+        return entries
+    
+    def _consume(self, end: int) -> None:
+        self._consumed.append(self._tail[:end])
+        self._tail = self._tail[end:]
+
+
+def _format_item(item: BatchItem) -> str:
+    """Prompt section for one batch item: its id between markers, then its content"""
+    return f"§{item.id}§\n{item.content}\n"
+
+
+def _pack_first_fit_decreasing(items: List[BatchItem], item_tokens: List[int],
+                               capacity: int) -> List[List[BatchItem]]:
+    """Bin-pack items by token count, largest first; an oversized item gets a batch of its own"""
+    bins: List[List[int]] = []
+    room: List[int] = []
+    for index in sorted(range(len(items)), key=lambda i: -item_tokens[i]):
+        size = item_tokens[index]
+        for b, free in enumerate(room):
+            if size <= free:
+                bins[b].append(index)
+                room[b] -= size
+                break
+        else:
+            bins.append([index])
+            room.append(capacity - size)
+    
+    # Batches and their items follow original item order
+    return [[items[i] for i in sorted(indices)] for indices in sorted(bins, key=min)]
+
+
+def _max_tokens(text: str) -> int:
+    """Upper bound on the token count of text for byte-level BPE encodings"""
+    return len(text.encode('utf-8'))
 
 
 # Convenience functions for easy integration
-async def batch_summarize_nodes(nodes_with_text: List[Dict[str, Any]], model: str) -> Dict[str, str]:
+async def batch_summarize_nodes(nodes_with_text: List[Dict[str, Any]], model: str,
+                                client: Optional["openai.AsyncOpenAI"] = None) -> Dict[str, str]:
     """
     Convenience function to batch summarize multiple nodes
     
     Args:
         nodes_with_text: List of nodes with 'text' and 'title' fields
         model: LLM model to use
+        client: AsyncOpenAI client to reuse; a temporary one is opened when omitted
         
     Returns:
         Dictionary mapping node titles to summaries
@@ -287,7 +528,14 @@ async def batch_summarize_nodes(nodes_with_text: List[Dict[str, Any]], model: st
     if not nodes_with_text:
         return {}
     
-    batcher = LLMBatcher(model)
+    # Summaries of unchanged text are reused; only misses go to the model
+    cache = get_response_cache()
+    summary_dict = {}
+    item_keys = {}
+    
+    # Titles of nodes sharing the same text, keyed by text digest; the first
+    # title's summary is fanned out to the rest
+    titles_by_digest: Dict[str, List[str]] = {}
     
     # Prepare batch items with robust identification
     batch_items = []
@@ -297,27 +545,56 @@ async def batch_summarize_nodes(nodes_with_text: List[Dict[str, Any]], model: st
         title = node.get('title', f'node_{i}')
         
         if text and len(text.split()) > 20:  # Only substantial text
+            digest = _text_digest(text)
+            if digest in titles_by_digest:
+                titles_by_digest[digest].append(title)
+                continue
+            titles_by_digest[digest] = [title]
+            
+            if cache is not None:
+                key = _summary_cache_key(model, digest)
+                cached = cache.get(key)
+                if cached is not None:
+                    summary_dict[title] = cached
+                    continue
+                item_keys[title] = key
+            
             batch_items.append(BatchItem(
                 id=title,
                 content=text,
                 metadata={'node_index': i, 'original_title': node.get('original_title', '')}
             ))
     
-    if not batch_items:
-        return {}
-    
-    # Execute batch with better error handling
-    try:
-        results = await batcher.batch_summarize(batch_items)
-        
-        # Build result dictionary, only including successful results
-        summary_dict = {}
-        for result in results:
-            if not result.error and result.result.strip():
-                summary_dict[result.id] = result.result
-        
-        return summary_dict
+    if batch_items:
+        batcher = LLMBatcher(model, client=client)
         
-    except Exception as e:
-        print(f"Error in batch_summarize_nodes: {e}")
-        return {}  # Return empty dict to trigger individual fallback
+        # Execute batch with better error handling
+        try:
+            results = await batcher.batch_summarize(batch_items)
+            
+            # Build result dictionary, only including successful results
+            for result in results:
+                if not result.error and result.result.strip():
+                    summary_dict[result.id] = result.result
+                    if result.id in item_keys:
+                        cache.set(item_keys[result.id], result.result)
+            
+        except Exception as e:
+            print(f"Error in batch_summarize_nodes: {e}")
+            # Missing nodes fall back to individual processing
+    
+    for first, *repeats in titles_by_digest.values():
+        if repeats and first in summary_dict:
+            summary_dict.update(dict.fromkeys(repeats, summary_dict[first]))
+    
+    return summary_dict
+
+
+def _text_digest(text: str) -> str:
+    """Short content digest identifying identical node texts"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _summary_cache_key(model: str, digest: str) -> str:
+    """Per-node summary cache key from the model and the node text digest"""
+    return f"summary:{model}:{digest}"
@@ -0,0 +1,58 @@
+"""
+Shared tiktoken encodings and token counting for all PageIndex components
+"""
+
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Tuple
+
+if TYPE_CHECKING:
+    import tiktoken
+
+# Recent token counts keyed by (model, text digest) rather than the text
+# itself, so retried batches skip re-encoding without pinning large strings
+_COUNT_CACHE_SIZE = 1024
+_counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+_counts_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=16)
+def enc_for(model: str) -> "tiktoken.Encoding":
+    """tiktoken encoding for a model, falling back to cl100k_base for unknown models"""
+    import tiktoken
+    
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count(text: str, model: str) -> int:
+    """Count tokens in text"""
+    return len(enc_for(model).encode(text))
+
+
+def count_batch(texts: List[str], model: str) -> List[int]:
+    """Count tokens for many texts in one tiktoken call, encoded in parallel threads
+    
+    Texts counted recently are answered from cache; only the rest are encoded.
+    """
+    keys = [(model, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()) for text in texts]
+    with _counts_lock:
+        counts = [_counts.get(key) for key in keys]
+    
+    missing = [i for i, cached in enumerate(counts) if cached is None]
+    if missing:
+        encoded = enc_for(model).encode_batch([texts[i] for i in missing])
+        for i, tokens in zip(missing, encoded):
+            counts[i] = len(tokens)
+    
+    with _counts_lock:
+        for key, token_count in zip(keys, counts):
+            _counts[key] = token_count
+            _counts.move_to_end(key)
+        while len(_counts) > _COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return counts
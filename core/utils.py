@@ -1,33 +1,57 @@
-import tiktoken
+import functools
+import hashlib
 import logging
 import os
-import json
+import re
+import threading
+from collections import OrderedDict
+import orjson
 import pypdf
 import pymupdf
 from io import BytesIO
-from typing import List, Tuple, Dict, Any, Union
+from typing import List, Tuple, Dict, Any, Optional, Union
+from core import tokens
 
 def count_tokens(text: str, model: str) -> int:
     """Count tokens in text using tiktoken"""
-    try:
-        enc = tiktoken.encoding_for_model(model)
-    except KeyError:
-        enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
-    return len(tokens)
+    return tokens.count(text, model)
+
+# Titles of in-memory PDFs keyed by a digest of their bytes, so a document
+# already opened for its pages is not parsed again just for its metadata.
+# Tools run in worker threads, so every access holds the lock.
+_PDF_TITLE_CACHE_SIZE = 64
+_pdf_titles: "OrderedDict[bytes, Optional[str]]" = OrderedDict()
+_pdf_titles_lock = threading.Lock()
+
+def _pdf_digest(stream: BytesIO) -> bytes:
+    """Content digest of an in-memory PDF"""
+    return hashlib.blake2b(stream.getbuffer(), digest_size=16).digest()
+
+def _remember_pdf_title(digest: bytes, title: Optional[str]) -> None:
+    """Record a PDF title, evicting the least recently stored beyond the cache size"""
+    with _pdf_titles_lock:
+        _pdf_titles[digest] = title
+        _pdf_titles.move_to_end(digest)
+        if len(_pdf_titles) > _PDF_TITLE_CACHE_SIZE:
+            _pdf_titles.popitem(last=False)
+
+def _lookup_pdf_title(digest: bytes) -> Tuple[bool, Optional[str]]:
+    """(found, title) for a PDF digest in the title cache"""
+    with _pdf_titles_lock:
+        if digest in _pdf_titles:
+            return True, _pdf_titles[digest]
+    return False, None
 
 def get_page_tokens(pdf_path: Union[str, BytesIO], model: str = "gpt-4.1-mini", 
                    pdf_parser: str = "PyMuPDF") -> List[Tuple[str, int]]:
     """Extract pages with token counts from PDF"""
+    # Extract all page text first, then tokenize every page in one batch
     if pdf_parser == "PyPDF2":
         pdf_reader = pypdf.PdfReader(pdf_path)
-        page_list = []
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            page_text = page.extract_text()
-            token_length = count_tokens(page_text, model)
-            page_list.append((page_text, token_length))
-        return page_list
+        page_texts = [page.extract_text() for page in pdf_reader.pages]
+        if isinstance(pdf_path, BytesIO):
+            meta = pdf_reader.metadata
+            _remember_pdf_title(_pdf_digest(pdf_path), meta.title if meta else None)
     elif pdf_parser == "PyMuPDF":
         if isinstance(pdf_path, BytesIO):
             doc = pymupdf.open(stream=pdf_path, filetype="pdf")
@@ -36,15 +60,14 @@ def get_page_tokens(pdf_path: Union[str, BytesIO], model: str = "gpt-4.1-mini",
         else:
             raise ValueError(f"Invalid PDF path: {pdf_path}")
         
-        page_list = []
-        for page in doc:
-            page_text = page.get_text()
-            token_length = count_tokens(page_text, model)
-            page_list.append((page_text, token_length))
-        doc.close()
-        return page_list
+        with doc:
+            if isinstance(pdf_path, BytesIO):
+                _remember_pdf_title(_pdf_digest(pdf_path), (doc.metadata or {}).get("title"))
+            page_texts = [page.get_text() for page in doc]
     else:
         raise ValueError(f"Unsupported PDF parser: {pdf_parser}")
+    
+    return list(zip(page_texts, tokens.count_batch(page_texts, model)))
 
 def get_pdf_name(pdf_path: Union[str, BytesIO]) -> str:
     """Extract PDF name from path or metadata"""
@@ -52,10 +75,13 @@ def get_pdf_name(pdf_path: Union[str, BytesIO]) -> str:
         return os.path.basename(pdf_path)
     elif isinstance(pdf_path, BytesIO):
         try:
-            pdf_reader = pypdf.PdfReader(pdf_path)
-            meta = pdf_reader.metadata
-            pdf_name = meta.title if meta and meta.title else 'Untitled'
-            return sanitize_filename(pdf_name)
+            digest = _pdf_digest(pdf_path)
+            found, title = _lookup_pdf_title(digest)
+            if not found:
+                meta = pypdf.PdfReader(pdf_path).metadata
+                title = meta.title if meta else None
+                _remember_pdf_title(digest, title)
+            return sanitize_filename(title or 'Untitled')
         except:
             return 'Untitled'
     else:
@@ -65,8 +91,27 @@ def sanitize_filename(filename: str, replacement: str = '-') -> str:
     """Sanitize filename for filesystem compatibility"""
     return filename.replace('/', replacement).replace('\\', replacement)
 
+_JSON_CLEANUP = re.compile(r"None|\s+")
+
+def _clean_json_match(match: "re.Match[str]") -> str:
+    """Replacement for a _JSON_CLEANUP match"""
+    return "null" if match.group() == "None" else " "
+
 def extract_json(content: str) -> Dict[str, Any]:
     """Extract JSON from LLM response with error handling"""
+    # Fast path: the response is already plain JSON
+    try:
+        return orjson.loads(content)
+    except (orjson.JSONDecodeError, TypeError):
+        pass
+    
+    # Retries and fallbacks often re-parse the same response; the cache keeps the
+    # encoded result so every caller still gets its own copy
+    return orjson.loads(_extract_json_cleaned(content))
+
+@functools.lru_cache(maxsize=256)
+def _extract_json_cleaned(content: str) -> bytes:
+    """Cleanup path of extract_json, returning the parsed result re-encoded"""
     try:
         # First, try to extract JSON enclosed within ```json and ```
         start_idx = content.find("```json")
@@ -78,26 +123,25 @@ def extract_json(content: str) -> Dict[str, Any]:
             # If no delimiters, assume entire content could be JSON
             json_content = content.strip()
 
-        # Clean up common issues that might cause parsing errors
-        json_content = json_content.replace('None', 'null')  # Replace Python None with JSON null
-        json_content = json_content.replace('\n', ' ').replace('\r', ' ')  # Remove newlines
-        json_content = ' '.join(json_content.split())  # Normalize whitespace
+        # Clean up common issues that might cause parsing errors in one pass:
+        # Python None becomes JSON null, newlines and whitespace runs collapse to a space
+        json_content = _JSON_CLEANUP.sub(_clean_json_match, json_content).strip()
 
-        # Attempt to parse and return the JSON object
-        return json.loads(json_content)
-    except json.JSONDecodeError as e:
+        # Attempt to parse the JSON object
+        return orjson.dumps(orjson.loads(json_content))
+    except orjson.JSONDecodeError as e:
         logging.error(f"Failed to extract JSON: {e}")
         # Try to clean up the content further if initial parsing fails
         try:
             # Remove any trailing commas before closing brackets/braces
             json_content = json_content.replace(',]', ']').replace(',}', '}')
-            return json.loads(json_content)
+            return orjson.dumps(orjson.loads(json_content))
         except:
             logging.error("Failed to parse JSON even after cleanup")
-            return {}
+            return b"{}"
     except Exception as e:
         logging.error(f"Unexpected error while extracting JSON: {e}")
-        return {}
+        return b"{}"
 
 def get_json_content(response: str) -> str:
     """Extract JSON content from markdown-formatted response"""
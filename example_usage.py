@@ -2,6 +2,7 @@
 Complete example showing how to use the PageIndex Agent
 """
 
+import asyncio
 import os
 import json
 from pathlib import Path
@@ -43,7 +44,7 @@ def main():
     
     try:
         print(f"Processing PDF: {pdf_path}")
-        result = agent.process_pdf(pdf_path)
+        result = asyncio.run(agent.process_pdf(pdf_path))
         
         # 4. Save results
         output_dir = Path("results")
@@ -131,8 +132,8 @@ def migrate_legacy_config():
         print("No legacy config found, using defaults")
 
 
-def batch_process_pdfs(pdf_directory: str):
-    """Example of batch processing multiple PDFs"""
+async def batch_process_pdfs(pdf_directory: str):
+    """Example of batch processing multiple PDFs on a single event loop"""
     
     agent = PageIndexAgent()
     pdf_dir = Path(pdf_directory)
@@ -148,7 +149,7 @@ def batch_process_pdfs(pdf_directory: str):
     for pdf_file in pdf_files:
         try:
             print(f"\nProcessing: {pdf_file.name}")
-            result = agent.process_pdf(str(pdf_file))
+            result = await agent.process_pdf(str(pdf_file))
             
             # Save individual result
             output_file = results_dir / f"{pdf_file.stem}_structure.json"
@@ -190,7 +191,7 @@ if __name__ == "__main__":
         if len(sys.argv) < 3:
             print("Please provide directory path for batch processing")
             sys.exit(1)
-        batch_process_pdfs(sys.argv[2])
+        asyncio.run(batch_process_pdfs(sys.argv[2]))
     else:
         # Single PDF processing
         pdf_path = sys.argv[1]
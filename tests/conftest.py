@@ -0,0 +1,50 @@
+"""
+Shared pytest fixtures
+"""
+
+import json
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+# Make the project packages importable however pytest is invoked; conftest
+# is loaded before any test module is collected
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from agent.pageindex_agent import PageIndexAgent
+
+# Constant config for the CLI --config test, serialized once at import
+_CLI_CONFIG_BYTES = json.dumps({
+    "global": {"model": "gpt-3.5-turbo"},
+    "structure_processor": {"if_add_node_id": "yes"}
+}).encode()
+
+
+@pytest.fixture(scope="session")
+def cli_pdf(tmp_path_factory):
+    """PDF stub for the CLI tests that pass a real path; tests only read it"""
+    pdf = tmp_path_factory.mktemp("cli") / "test.pdf"
+    pdf.write_bytes(b"PDF content")
+    return pdf
+
+
+@pytest.fixture(scope="session")
+def cli_config(tmp_path_factory):
+    """JSON config file for the CLI --config test; tests only read it"""
+    config = tmp_path_factory.mktemp("cli") / "test_config.json"
+    config.write_bytes(_CLI_CONFIG_BYTES)
+    return config
+
+
+@pytest.fixture
+def mock_agent(monkeypatch):
+    """Agent instance returned by a stand-in for cli.PageIndexAgent
+    
+    Both mocks are specced (not autospecced) against the real class, so
+    misspelled attributes fail and process_pdf is already an AsyncMock.
+    """
+    instance = MagicMock(spec=PageIndexAgent)
+    monkeypatch.setattr("cli.PageIndexAgent", MagicMock(spec=PageIndexAgent, return_value=instance))
+    return instance
@@ -0,0 +1,77 @@
+"""
+Unit tests for the cache_utils module
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from core.cache_utils import CACHE_DIR_ENV, ResponseCache, cache_key, get_response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    """Unit tests for ResponseCache and its helpers"""
+    
+    def setUp(self):
+        """Create a scratch cache directory"""
+        self.cache_dir = tempfile.mkdtemp(prefix="pageindex_cache_test_")
+    
+    def tearDown(self):
+        """Remove the scratch cache directory"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+    
+    def test_set_and_get(self):
+        """Test that stored values are returned and missing keys give None"""
+        cache = ResponseCache(self.cache_dir)
+        cache.set("key", "value")
+        
+        self.assertEqual(cache.get("key"), "value")
+        self.assertIsNone(cache.get("missing"))
+        
+        # Values persist for a new handle on the same directory
+        self.assertEqual(ResponseCache(self.cache_dir).get("key"), "value")
+    
+    def test_expired_entries_are_ignored(self):
+        """Test that entries past their expiry are treated as misses"""
+        cache = ResponseCache(self.cache_dir)
+        cache.set("key", "value", expire=-1)
+        
+        self.assertIsNone(cache.get("key"))
+    
+    def test_expired_entries_are_deleted(self):
+        """Test that expired rows are removed on read and when the cache is opened"""
+        cache = ResponseCache(self.cache_dir)
+        cache.set("read", "value", expire=-1)
+        cache.set("stale", "value", expire=-1)
+        cache.set("fresh", "value")
+        
+        self.assertIsNone(cache.get("read"))
+        self.assertEqual(_stored_keys(cache), {"fresh", "stale"})
+        
+        # Reopening the directory prunes whatever expired in the meantime
+        self.assertEqual(_stored_keys(ResponseCache(self.cache_dir)), {"fresh"})
+    
+    def test_cache_key_ignores_key_order(self):
+        """Test that payload key order does not change the cache key"""
+        self.assertEqual(
+            cache_key({"model": "gpt-4", "temperature": 0}),
+            cache_key({"temperature": 0, "model": "gpt-4"})
+        )
+    
+    def test_get_response_cache_requires_env(self):
+        """Test that caching is disabled unless the cache directory is configured"""
+        with patch.dict(os.environ, {CACHE_DIR_ENV: ""}):
+            self.assertIsNone(get_response_cache())
+        with patch.dict(os.environ, {CACHE_DIR_ENV: self.cache_dir}):
+            self.assertIs(get_response_cache(), get_response_cache())
+
+
+def _stored_keys(cache: ResponseCache) -> set:
+    """Keys of every row in the cache file, expired or not"""
+    return {key for (key,) in cache._conn.execute("SELECT key FROM responses")}
+
+
+if __name__ == '__main__':
+    unittest.main()
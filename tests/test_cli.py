@@ -2,353 +2,259 @@
 Unit tests for the cli module
 """
 
-import unittest
-import tempfile
-import json
-from pathlib import Path
-from unittest.mock import patch, MagicMock
+import sys
 
-from cli import main
+import pytest
 
+import cli
+from cli import main, count_nodes
 
-class TestCLI(unittest.TestCase):
-    """Unit tests for CLI functionality"""
-    
-    def setUp(self):
-        """Set up test data"""
-        # Create a temporary directory for test files
-        self.test_dir = Path(tempfile.mkdtemp(prefix="pageindex_cli_test_"))
-        
-        # Create a test PDF file
-        self.test_pdf = self.test_dir / "test.pdf"
-        self.test_pdf.write_text("PDF content")
-        
-        # Create a test config file
-        self.test_config = self.test_dir / "test_config.json"
-        config_data = {
-            "global": {"model": "gpt-3.5-turbo"},
-            "structure_processor": {"if_add_node_id": "yes"}
-        }
-        self.test_config.write_text(json.dumps(config_data))
-        
-        # Create test output file path
-        self.test_output = self.test_dir / "output.json"
-    
-    def tearDown(self):
-        """Clean up test files"""
-        # Clean up test directory
-        import shutil
-        shutil.rmtree(self.test_dir, ignore_errors=True)
-    
-    # Test for missing PDF file validation has been temporarily disabled
-    # due to complexity in mocking the CLI behavior correctly.
-    # TODO: Reimplement this test with proper mocking approach.
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_list_sessions(self, mock_agent_class):
-        """Test main function with --list-sessions argument"""
-        # Mock agent and its list_sessions method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock session data
-        mock_sessions = [
-            {"session_id": "session_1", "pdf_name": "test1.pdf", "current_step": "completed"},
-            {"session_id": "session_2", "pdf_name": "test2.pdf", "current_step": "processing"}
-        ]
-        mock_agent_instance.list_sessions.return_value = mock_sessions
-        
-        # Mock sys.argv with a dummy pdf_path (required by current CLI design)
-        with patch('sys.argv', ['cli.py', 'dummy.pdf', '--list-sessions']):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that list_sessions was called
-                mock_agent_instance.list_sessions.assert_called_once()
-                
-                # Check that session information was printed
-                mock_print.assert_any_call("Found 2 processing sessions:")
-                mock_print.assert_any_call("  session_1: test1.pdf - completed")
-                mock_print.assert_any_call("  session_2: test2.pdf - processing")
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_list_sessions_empty(self, mock_agent_class):
-        """Test main function with --list-sessions argument and no sessions"""
-        # Mock agent and its list_sessions method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        mock_agent_instance.list_sessions.return_value = []
-        
-        # Mock sys.argv with a dummy pdf_path (required by current CLI design)
-        with patch('sys.argv', ['cli.py', 'dummy.pdf', '--list-sessions']):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that list_sessions was called
-                mock_agent_instance.list_sessions.assert_called_once()
-                
-                # Check that no sessions message was printed
-                mock_print.assert_called_with("No processing sessions found")
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_session_status_found(self, mock_agent_class):
-        """Test main function with --session-status argument for existing session"""
-        # Mock agent and its get_processing_status method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock status data
-        mock_status = {
+
+# Test for missing PDF file validation has been temporarily disabled
+# due to complexity in mocking the CLI behavior correctly.
+# TODO: Reimplement this test with proper mocking approach.
+
+
+@pytest.fixture
+def tmp_cwd(tmp_path, monkeypatch):
+    """Run the test from tmp_path, where main() writes its default output file"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_main_list_sessions(mock_agent, capsys, monkeypatch):
+    """Test main function with --list-sessions argument"""
+    # Mock session data
+    mock_sessions = [
+        {"session_id": "session_1", "pdf_name": "test1.pdf", "current_step": "completed"},
+        {"session_id": "session_2", "pdf_name": "test2.pdf", "current_step": "processing"}
+    ]
+    mock_agent.list_sessions.return_value = mock_sessions
+    
+    # Mock sys.argv with a dummy pdf_path (required by current CLI design)
+    monkeypatch.setattr(sys, "argv", ['cli.py', 'dummy.pdf', '--list-sessions'])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that list_sessions was called
+    mock_agent.list_sessions.assert_called_once()
+    
+    # Check that session information was printed
+    assert "Found 2 processing sessions:" in out
+    assert "  session_1: test1.pdf - completed" in out
+    assert "  session_2: test2.pdf - processing" in out
+
+
+def test_main_list_sessions_empty(mock_agent, capsys, monkeypatch):
+    """Test main function with --list-sessions argument and no sessions"""
+    mock_agent.list_sessions.return_value = []
+    
+    # Mock sys.argv with a dummy pdf_path (required by current CLI design)
+    monkeypatch.setattr(sys, "argv", ['cli.py', 'dummy.pdf', '--list-sessions'])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that list_sessions was called
+    mock_agent.list_sessions.assert_called_once()
+    
+    # Check that no sessions message was printed
+    assert out.endswith("No processing sessions found\n")
+
+
+@pytest.mark.parametrize("session_id, status, expected_output, exit_codes", [
+    (
+        "test_session",
+        {
             "status": "found",
             "session_id": "test_session",
             "current_step": "completed",
             "processing_log": ["Step 1", "Step 2"]
-        }
-        mock_agent_instance.get_processing_status.return_value = mock_status
-        
-        # Mock sys.argv with a dummy pdf_path (required by current CLI design)
-        with patch('sys.argv', ['cli.py', 'dummy.pdf', '--session-status', 'test_session']):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that get_processing_status was called
-                mock_agent_instance.get_processing_status.assert_called_once_with("test_session")
-                
-                # Check that status information was printed
-                mock_print.assert_any_call("Session: test_session")
-                mock_print.assert_any_call("Current step: completed")
-                mock_print.assert_any_call("Processing log:")
-                mock_print.assert_any_call("  - Step 1")
-                mock_print.assert_any_call("  - Step 2")
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_session_status_not_found(self, mock_agent_class):
-        """Test main function with --session-status argument for non-existent session"""
-        # Mock agent and its get_processing_status method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock status data
-        mock_status = {"status": "not_found"}
-        mock_agent_instance.get_processing_status.return_value = mock_status
-        
-        # Mock sys.argv with a dummy pdf_path (required by current CLI design) and sys.exit
-        with patch('sys.argv', ['cli.py', 'dummy.pdf', '--session-status', 'nonexistent_session']):
-            with patch('sys.exit') as mock_exit:
-                with patch('builtins.print') as mock_print:
-                    main()
-                    
-                    # Check that get_processing_status was called
-                    mock_agent_instance.get_processing_status.assert_called_once_with("nonexistent_session")
-                    
-                    # Check that error message was printed
-                    mock_print.assert_called_with("Session not found: nonexistent_session")
-                    
-                    # Check that sys.exit was called with code 1
-                    mock_exit.assert_called_once_with(1)
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_session_status_error(self, mock_agent_class):
-        """Test main function with --session-status argument with error"""
-        # Mock agent and its get_processing_status method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock status data
-        mock_status = {"status": "error", "error": "Test error"}
-        mock_agent_instance.get_processing_status.return_value = mock_status
-        
-        # Mock sys.argv with a dummy pdf_path (required by current CLI design) and sys.exit
-        with patch('sys.argv', ['cli.py', 'dummy.pdf', '--session-status', 'error_session']):
-            with patch('sys.exit') as mock_exit:
-                with patch('builtins.print') as mock_print:
-                    main()
-                    
-                    # Check that get_processing_status was called
-                    mock_agent_instance.get_processing_status.assert_called_once_with("error_session")
-                    
-                    # Check that error message was printed
-                    mock_print.assert_called_with("Error reading session: Test error")
-                    
-                    # Check that sys.exit was called with code 1
-                    mock_exit.assert_called_once_with(1)
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_process_pdf_success(self, mock_agent_class):
-        """Test main function processing PDF successfully"""
-        # Mock agent and its process_pdf method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock result data
-        mock_result = {
-            "doc_name": "test.pdf",
-            "doc_description": "Test document",
-            "structure": [
-                {"title": "Introduction", "nodes": []},
-                {"title": "Methods", "nodes": []}
-            ]
-        }
-        mock_agent_instance.process_pdf.return_value = mock_result
-        
-        # Mock sys.argv
-        with patch('sys.argv', ['cli.py', str(self.test_pdf)]):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that process_pdf was called
-                mock_agent_instance.process_pdf.assert_called_once_with(str(self.test_pdf))
-                
-                # Check that success message was printed
-                mock_print.assert_any_call("Processing completed successfully!")
-                
-                # Check that output file was created
-                output_file = Path("test_structure.json")
-                self.assertTrue(output_file.exists())
-                
-                # Clean up
-                if output_file.exists():
-                    output_file.unlink()
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_process_pdf_with_output_path(self, mock_agent_class):
-        """Test main function processing PDF with custom output path"""
-        # Mock agent and its process_pdf method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock result data
-        mock_result = {"doc_name": "test.pdf", "structure": []}
-        mock_agent_instance.process_pdf.return_value = mock_result
-        
-        # Mock sys.argv
-        with patch('sys.argv', ['cli.py', str(self.test_pdf), '--output', str(self.test_output)]):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that process_pdf was called
-                mock_agent_instance.process_pdf.assert_called_once_with(str(self.test_pdf))
-                
-                # Check that success message was printed
-                mock_print.assert_any_call("Processing completed successfully!")
-                mock_print.assert_any_call(f"Results saved to: {self.test_output}")
-                
-                # Check that output file was created
-                self.assertTrue(self.test_output.exists())
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_process_pdf_with_config(self, mock_agent_class):
-        """Test main function processing PDF with config file"""
-        # Mock agent and its process_pdf method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock result data
-        mock_result = {"doc_name": "test.pdf", "structure": []}
-        mock_agent_instance.process_pdf.return_value = mock_result
-        
-        # Mock sys.argv
-        with patch('sys.argv', ['cli.py', str(self.test_pdf), '--config', str(self.test_config)]):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that agent was initialized with config overrides
-                # Note: We can't easily check the exact config_overrides passed to the constructor
-                # but we can check that the agent was instantiated
-                self.assertTrue(mock_agent_class.called)
-                
-                # Check that process_pdf was called
-                mock_agent_instance.process_pdf.assert_called_once_with(str(self.test_pdf))
-                
-                # Check that success message was printed
-                mock_print.assert_any_call("Processing completed successfully!")
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_process_pdf_with_enhancement_flags(self, mock_agent_class):
-        """Test main function processing PDF with enhancement flags"""
-        # Mock agent and its process_pdf method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock result data
-        mock_result = {"doc_name": "test.pdf", "structure": []}
-        mock_agent_instance.process_pdf.return_value = mock_result
-        
-        # Mock sys.argv
-        with patch('sys.argv', ['cli.py', str(self.test_pdf), '--add-summaries', '--add-text', '--no-node-ids']):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that agent was initialized with config overrides
-                # Note: We can't easily check the exact config_overrides passed to the constructor
-                # but we can check that the agent was instantiated
-                self.assertTrue(mock_agent_class.called)
-                
-                # Check that process_pdf was called
-                mock_agent_instance.process_pdf.assert_called_once_with(str(self.test_pdf))
-                
-                # Check that success message was printed
-                mock_print.assert_any_call("Processing completed successfully!")
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_process_pdf_with_verbose(self, mock_agent_class):
-        """Test main function processing PDF with verbose output"""
-        # Mock agent and its process_pdf method
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        
-        # Mock result data
-        mock_result = {
-            "doc_name": "test.pdf",
-            "doc_description": "Test document",
-            "structure": [
-                {"title": "Introduction", "nodes": []},
-                {"title": "Methods", "nodes": [
-                    {"title": "Submethod 1", "nodes": []}
-                ]}
-            ]
-        }
-        mock_agent_instance.process_pdf.return_value = mock_result
-        
-        # Mock sys.argv
-        with patch('sys.argv', ['cli.py', str(self.test_pdf), '--verbose']):
-            with patch('builtins.print') as mock_print:
-                main()
-                
-                # Check that process_pdf was called
-                mock_agent_instance.process_pdf.assert_called_once_with(str(self.test_pdf))
-                
-                # Check that verbose messages were printed
-                mock_print.assert_any_call("Initializing PageIndex Agent...")
-                mock_print.assert_any_call(f"Processing PDF: {self.test_pdf}")
-                mock_print.assert_any_call("Processing completed successfully!")
-                mock_print.assert_any_call("\nDocument: test.pdf")
-                mock_print.assert_any_call("Description: Test document")
-                mock_print.assert_any_call("Total sections extracted: 3")
-    
-    @patch('cli.PageIndexAgent')
-    def test_main_process_pdf_exception(self, mock_agent_class):
-        """Test main function handling exception during PDF processing"""
-        # Mock agent to raise an exception
-        mock_agent_instance = MagicMock()
-        mock_agent_class.return_value = mock_agent_instance
-        mock_agent_instance.process_pdf.side_effect = Exception("Test error")
-        
-        # Mock sys.argv and sys.exit
-        with patch('sys.argv', ['cli.py', str(self.test_pdf)]):
-            with patch('sys.exit') as mock_exit:
-                with patch('builtins.print') as mock_print:
-                    main()
-                    
-                    # Check that process_pdf was called
-                    mock_agent_instance.process_pdf.assert_called_once_with(str(self.test_pdf))
-                    
-                    # Check that error message was printed
-                    mock_print.assert_any_call("Error: Test error")
-                    
-                    # Check that sys.exit was called with code 1
-                    mock_exit.assert_called_once_with(1)
+        },
+        "Session: test_session\nCurrent step: completed\nProcessing log:\n  - Step 1\n  - Step 2\n",
+        []
+    ),
+    ("nonexistent_session", {"status": "not_found"}, "Session not found: nonexistent_session\n", [1]),
+    ("error_session", {"status": "error", "error": "Test error"}, "Error reading session: Test error\n", [1]),
+], ids=["found", "not_found", "error"])
+def test_main_session_status(mock_agent, capsys, monkeypatch, session_id, status, expected_output, exit_codes):
+    """Test main function with --session-status argument for each status outcome"""
+    mock_agent.get_processing_status.return_value = status
+    
+    # Mock sys.argv with a dummy pdf_path (required by current CLI design) and sys.exit
+    monkeypatch.setattr(sys, "argv", ['cli.py', 'dummy.pdf', '--session-status', session_id])
+    exits = []
+    monkeypatch.setattr(sys, "exit", exits.append)
+    
+    main()
+    
+    mock_agent.get_processing_status.assert_called_once_with(session_id)
+    assert capsys.readouterr().out == expected_output
+    assert exits == exit_codes
 
 
-if __name__ == '__main__':
-    unittest.main()
+def test_main_process_pdf_success(mock_agent, cli_pdf, tmp_cwd, monkeypatch, capsys):
+    """Test main function processing PDF successfully"""
+    # Mock result data
+    mock_result = {
+        "doc_name": "test.pdf",
+        "doc_description": "Test document",
+        "structure": [
+            {"title": "Introduction", "nodes": []},
+            {"title": "Methods", "nodes": []}
+        ]
+    }
+    mock_agent.process_pdf.return_value = mock_result
+    
+    # Mock sys.argv
+    monkeypatch.setattr(sys, "argv", ['cli.py', str(cli_pdf)])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that process_pdf was called
+    mock_agent.process_pdf.assert_called_once_with(str(cli_pdf))
+    
+    # Check that success message was printed
+    assert "Processing completed successfully!" in out
+    
+    # Check that output file was created
+    assert (tmp_cwd / "test_structure.json").exists()
+
+
+def test_main_process_pdf_with_output_path(mock_agent, cli_pdf, tmp_path, capsys, monkeypatch):
+    """Test main function processing PDF with custom output path"""
+    # Mock result data
+    mock_result = {"doc_name": "test.pdf", "structure": []}
+    mock_agent.process_pdf.return_value = mock_result
+    output_path = tmp_path / "output.json"
+    
+    # Mock sys.argv
+    monkeypatch.setattr(sys, "argv", ['cli.py', str(cli_pdf), '--output', str(output_path)])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that process_pdf was called
+    mock_agent.process_pdf.assert_called_once_with(str(cli_pdf))
+    
+    # Check that success message was printed
+    assert "Processing completed successfully!" in out
+    assert f"Results saved to: {output_path}" in out
+    
+    # Check that output file was created
+    assert output_path.exists()
+
+
+def test_main_process_pdf_with_config(mock_agent, cli_pdf, tmp_cwd, cli_config, capsys, monkeypatch):
+    """Test main function processing PDF with config file"""
+    # Mock result data
+    mock_result = {"doc_name": "test.pdf", "structure": []}
+    mock_agent.process_pdf.return_value = mock_result
+    
+    # Mock sys.argv
+    monkeypatch.setattr(sys, "argv", ['cli.py', str(cli_pdf), '--config', str(cli_config)])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that agent was initialized with config overrides
+    # Note: We can't easily check the exact config_overrides passed to the constructor
+    # but we can check that the agent was instantiated
+    cli.PageIndexAgent.assert_called_once()
+    
+    # Check that process_pdf was called
+    mock_agent.process_pdf.assert_called_once_with(str(cli_pdf))
+    
+    # Check that success message was printed
+    assert "Processing completed successfully!" in out
+
+
+def test_main_process_pdf_with_enhancement_flags(mock_agent, cli_pdf, tmp_cwd, capsys, monkeypatch):
+    """Test main function processing PDF with enhancement flags"""
+    # Mock result data
+    mock_result = {"doc_name": "test.pdf", "structure": []}
+    mock_agent.process_pdf.return_value = mock_result
+    
+    # Mock sys.argv
+    monkeypatch.setattr(sys, "argv", ['cli.py', str(cli_pdf), '--add-summaries', '--add-text', '--no-node-ids'])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that agent was initialized with config overrides
+    # Note: We can't easily check the exact config_overrides passed to the constructor
+    # but we can check that the agent was instantiated
+    cli.PageIndexAgent.assert_called_once()
+    
+    # Check that process_pdf was called
+    mock_agent.process_pdf.assert_called_once_with(str(cli_pdf))
+    
+    # Check that success message was printed
+    assert "Processing completed successfully!" in out
+
+
+def test_main_process_pdf_with_verbose(mock_agent, cli_pdf, tmp_cwd, capsys, monkeypatch):
+    """Test main function processing PDF with verbose output"""
+    # Mock result data
+    mock_result = {
+        "doc_name": "test.pdf",
+        "doc_description": "Test document",
+        "structure": [
+            {"title": "Introduction", "nodes": []},
+            {"title": "Methods", "nodes": [
+                {"title": "Submethod 1", "nodes": []}
+            ]}
+        ]
+    }
+    mock_agent.process_pdf.return_value = mock_result
+    
+    # Mock sys.argv
+    monkeypatch.setattr(sys, "argv", ['cli.py', str(cli_pdf), '--verbose'])
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that process_pdf was called
+    mock_agent.process_pdf.assert_called_once_with(str(cli_pdf))
+    
+    # Check that verbose messages were printed
+    assert "Initializing PageIndex Agent..." in out
+    assert f"Processing PDF: {cli_pdf}" in out
+    assert "Processing completed successfully!" in out
+    assert "\nDocument: test.pdf" in out
+    assert "Description: Test document" in out
+    assert "Total sections extracted: 3" in out
+
+
+def test_main_process_pdf_exception(mock_agent, cli_pdf, capsys, monkeypatch):
+    """Test main function handling exception during PDF processing"""
+    # Mock agent to raise an exception
+    mock_agent.process_pdf.side_effect = Exception("Test error")
+    
+    # Mock sys.argv and sys.exit
+    monkeypatch.setattr(sys, "argv", ['cli.py', str(cli_pdf)])
+    exits = []
+    monkeypatch.setattr(sys, "exit", exits.append)
+    
+    main()
+    out = capsys.readouterr().out
+    
+    # Check that process_pdf was called
+    mock_agent.process_pdf.assert_called_once_with(str(cli_pdf))
+    
+    # Check that error message was printed
+    assert "Error: Test error" in out
+    
+    # Check that sys.exit was called with code 1
+    assert exits == [1]
+
+
+def test_count_nodes_deep_structure():
+    """Test count_nodes on flat and very deep hierarchies"""
+    flat = [{"title": "A"}, {"title": "B", "nodes": [{"title": "B.1"}]}]
+    assert count_nodes(flat) == 3
+    
+    # Deeper than the default recursion limit
+    deep = []
+    level = deep
+    for _ in range(5000):
+        child = []
+        level.append({"title": "Section", "nodes": child})
+        level = child
+    assert count_nodes(deep) == 5000
+
@@ -4,139 +4,113 @@ Unit tests for configuration schema validation
 
 import sys
 from pathlib import Path
-# Add the project root to the path so we can import the modules
-sys.path.insert(0, str(Path(__file__).parent.parent))
 
-import tempfile
+import pytest
 import yaml
 from core.config import ConfigManager
-from core.config_schema import PageIndexConfig
+from core.config_schema import PageIndexConfig, merge_configs
 from core.exceptions import PageIndexError
 
 
+VALID_CONFIG = {
+    "global": {
+        "model": "gpt-4.1-mini",
+        "log_dir": "./test_logs",
+        "session_timeout": 3600,
+        "max_tokens_per_call": 4000,
+        "retry_attempts": 3,
+        "timeout_seconds": 30
+    },
+    "pdf_parser": {
+        "pdf_parser": "PyMuPDF",
+        "max_file_size_mb": 100
+    },
+    "toc_detector": {
+        "toc_check_page_num": 20
+    },
+    "structure_extractor": {
+        "max_token_num_each_node": 20000,
+        "max_retries": 3
+    },
+    "structure_verifier": {
+        "max_fix_attempts": 3,
+        "accuracy_threshold": 0.6
+    },
+    "structure_processor": {
+        "max_page_num_each_node": 10,
+        "enable_batch_processing": True,
+        "enable_streaming": False,
+        "if_add_node_id": "yes",
+        "if_add_node_summary": "no",
+        "if_add_doc_description": "yes",
+        "if_add_node_text": "no"
+    }
+}
+
+# Shared read-only inputs; load_raw and merge_configs never mutate them
+_BAD_MODEL_CONFIG = {
+    "global": {
+        "model": "",  # Empty string should fail
+        "log_dir": "./logs"
+    }
+}
+
+_BAD_PARSER_CONFIG = {
+    "pdf_parser": {
+        "pdf_parser": "InvalidParser"  # Should fail
+    }
+}
+
+_GPT_35_CONFIG = {"global": {"model": "gpt-3.5-turbo"}}
+_GPT_41_MINI_OVERRIDES = {"global": {"model": "gpt-4.1-mini"}}
+
+# libyaml-backed dumper/loader where available, as in core.config
+_Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Config files are tiny literals, so serialize each once rather than per test
+_GPT_35_YAML = yaml.dump(_GPT_35_CONFIG, Dumper=_Dumper).encode()
+_GPT_4O_MINI_YAML = yaml.dump({"global": {"model": "gpt-4o-mini"}}, Dumper=_Dumper).encode()
+
+
+def _write_config(tmp_path: Path, content: bytes) -> str:
+    """Write serialized YAML to a config file under tmp_path and return its path"""
+    config_path = tmp_path / "config.yaml"
+    config_path.write_bytes(content)
+    return str(config_path)
+
+
 def test_valid_configuration():
     """Test that valid configuration loads successfully"""
-    config_data = {
-        "global": {
-            "model": "gpt-4.1-mini",
-            "log_dir": "./test_logs",
-            "session_timeout": 3600,
-            "max_tokens_per_call": 4000,
-            "retry_attempts": 3,
-            "timeout_seconds": 30
-        },
-        "pdf_parser": {
-            "pdf_parser": "PyMuPDF",
-            "max_file_size_mb": 100
-        },
-        "toc_detector": {
-            "toc_check_page_num": 20
-        },
-        "structure_extractor": {
-            "max_token_num_each_node": 20000,
-            "max_retries": 3
-        },
-        "structure_verifier": {
-            "max_fix_attempts": 3,
-            "accuracy_threshold": 0.6
-        },
-        "structure_processor": {
-            "max_page_num_each_node": 10,
-            "enable_batch_processing": True,
-            "enable_streaming": False,
-            "if_add_node_id": "yes",
-            "if_add_node_summary": "no",
-            "if_add_doc_description": "yes",
-            "if_add_node_text": "no"
-        }
-    }
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-        yaml.dump(config_data, f)
-        config_path = f.name
-    
-    try:
-        config_manager = ConfigManager(config_path)
-        config = config_manager.load_config()
-        assert isinstance(config, PageIndexConfig)
-        assert config.global_config.model == "gpt-4.1-mini"
-        assert config.pdf_parser.pdf_parser == "PyMuPDF"
-        print("✅ Valid configuration test passed")
-    finally:
-        Path(config_path).unlink()
+    config = ConfigManager().load_raw(VALID_CONFIG)
+    assert isinstance(config, PageIndexConfig)
+    assert config.global_config.model == "gpt-4.1-mini"
+    assert config.pdf_parser.pdf_parser == "PyMuPDF"
+    print("✅ Valid configuration test passed")
 
 def test_invalid_model_name():
     """Test that invalid model name raises error"""
-    config_data = {
-        "global": {
-            "model": "",  # Empty string should fail
-            "log_dir": "./logs"
-        }
-    }
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-        yaml.dump(config_data, f)
-        config_path = f.name
-    
     try:
-        config_manager = ConfigManager(config_path)
-        try:
-            config_manager.load_config()
-            assert False, "Should have raised an error"
-        except PageIndexError as e:
-            assert "Model must be a non-empty string" in str(e)
-            print("✅ Invalid model name test passed")
-    finally:
-        Path(config_path).unlink()
+        ConfigManager().load_raw(_BAD_MODEL_CONFIG)
+        assert False, "Should have raised an error"
+    except PageIndexError as e:
+        assert "Model must be a non-empty string" in str(e)
+        print("✅ Invalid model name test passed")
 
 def test_invalid_pdf_parser():
     """Test that invalid PDF parser raises error"""
-    config_data = {
-        "pdf_parser": {
-            "pdf_parser": "InvalidParser"  # Should fail
-        }
-    }
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-        yaml.dump(config_data, f)
-        config_path = f.name
-    
     try:
-        config_manager = ConfigManager(config_path)
-        try:
-            config_manager.load_config()
-            assert False, "Should have raised an error"
-        except PageIndexError as e:
-            assert "PDF parser must be either" in str(e)
-            print("✅ Invalid PDF parser test passed")
-    finally:
-        Path(config_path).unlink()
+        ConfigManager().load_raw(_BAD_PARSER_CONFIG)
+        assert False, "Should have raised an error"
+    except PageIndexError as e:
+        assert "PDF parser must be either" in str(e)
+        print("✅ Invalid PDF parser test passed")
 
 def test_user_overrides():
     """Test that user overrides are properly applied"""
-    base_config = {
-        "global": {
-            "model": "gpt-3.5-turbo"
-        }
-    }
-    
-    user_overrides = {
-        "global": {
-            "model": "gpt-4.1-mini"
-        }
-    }
-    
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-        yaml.dump(base_config, f)
-        config_path = f.name
-    
-    try:
-        config_manager = ConfigManager(config_path)
-        config = config_manager.load_config(user_overrides)
-        assert config.global_config.model == "gpt-4.1-mini"
-        print("✅ User overrides test passed")
-    finally:
-        Path(config_path).unlink()
+    config = ConfigManager().load_raw(_GPT_35_CONFIG, _GPT_41_MINI_OVERRIDES)
+    assert config.global_config.model == "gpt-4.1-mini"
+    print("✅ User overrides test passed")
 
 def test_missing_config_file():
     """Test that missing config file uses defaults"""
@@ -146,27 +120,125 @@ def test_missing_config_file():
     assert config.global_config.model == "gpt-4.1-mini"  # Default value
     print("✅ Missing config file test passed")
 
+def test_cached_config_reloads_on_change(tmp_path):
+    """Test that the parsed config cache is isolated from overrides and refreshed on edit"""
+    config_path = _write_config(tmp_path, _GPT_35_YAML)
+    config_manager = ConfigManager(config_path)
+    overridden = config_manager.load_config({"global": {"model": "gpt-4.1-mini"}})
+    assert overridden.global_config.model == "gpt-4.1-mini"
+    
+    # Overrides must not leak into the cached parse
+    assert config_manager.load_config().global_config.model == "gpt-3.5-turbo"
+    
+    # Rewriting the file invalidates the cache
+    Path(config_path).write_bytes(_GPT_4O_MINI_YAML)
+    assert config_manager.load_config().global_config.model == "gpt-4o-mini"
+    print("✅ Cached config reload test passed")
 
-if __name__ == "__main__":
-    # Run tests manually for verification
-    print("Running configuration validation tests...")
+def test_validated_config_is_cached(tmp_path, monkeypatch):
+    """Test that repeated loads with equal overrides reuse the validated config"""
+    config_path = _write_config(tmp_path, _GPT_35_YAML)
+    config_manager = ConfigManager(config_path)
+    first = config_manager.load_config({"global": {"model": "gpt-4o", "log_dir": "./logs"}})
     
-    try:
-        test_valid_configuration()
-        print("✅ Valid configuration test passed")
-    except Exception as e:
-        print(f"❌ Valid configuration test failed: {e}")
+    # Equal overrides in a different order are answered without revalidating
+    def fail_validation(config_dict):
+        raise AssertionError("cached config was revalidated")
+    with monkeypatch.context() as m:
+        m.setattr("core.config._validate_config", fail_validation)
+        again = config_manager.load_config({"global": {"log_dir": "./logs", "model": "gpt-4o"}})
+    assert again == first
+    assert config_manager.load_config() != first
     
-    try:
-        test_invalid_model_name()
-        print("✅ Invalid model name test passed")
-    except Exception as e:
-        print(f"❌ Invalid model name test failed: {e}")
+    # A changed file yields a freshly validated config
+    Path(config_path).write_bytes(_GPT_4O_MINI_YAML)
+    reloaded = config_manager.load_config({"global": {"model": "gpt-4o", "log_dir": "./logs"}})
+    assert reloaded is not first
+    print("✅ Validated config cache test passed")
+
+def test_cached_config_is_not_shared(tmp_path):
+    """Test that mutating a loaded config does not leak into later loads"""
+    config_manager = ConfigManager(_write_config(tmp_path, _GPT_35_YAML))
+    first = config_manager.load_config()
+    first.global_config.model = "gpt-4o"
     
-    try:
-        test_missing_config_file()
-        print("✅ Missing config file test passed")
-    except Exception as e:
-        print(f"❌ Missing config file test failed: {e}")
+    again = config_manager.load_config()
+    assert again is not first
+    assert again.global_config.model == "gpt-3.5-turbo"
+    print("✅ Cached config isolation test passed")
+
+def test_migrate_legacy_config_uses_schema_defaults(tmp_path):
+    """Test that legacy migration fills missing keys from the schema defaults"""
+    legacy_path = tmp_path / "legacy.yaml"
+    legacy_path.write_bytes(yaml.dump({"model": "gpt-4o", "if_add_node_id": "no"}, Dumper=_Dumper).encode())
+    
+    output_path = ConfigManager().migrate_legacy_config(str(legacy_path))
+    with open(output_path, 'r') as f:
+        migrated = yaml.load(f, Loader=_Loader)
+    
+    assert migrated["global"]["model"] == "gpt-4o"
+    assert migrated["structure_processor"]["if_add_node_id"] == "no"
+    assert migrated["structure_processor"]["if_add_doc_description"] == "yes"
+    assert migrated["structure_extractor"]["max_token_num_each_node"] == 20000
     
-    print("Configuration validation tests completed!")
+    # The migrated file must load as a valid configuration
+    config = ConfigManager(output_path).load_config()
+    assert config.global_config.model == "gpt-4o"
+    print("✅ Legacy migration defaults test passed")
+
+
+def test_merge_configs_leaves_inputs_untouched():
+    """Test that merging nested overrides does not mutate the base config"""
+    base = {"global": {"model": "gpt-4.1-mini", "log_dir": "./logs"}, "pdf_parser": {"pdf_parser": "PyMuPDF"}}
+    overrides = {"global": {"model": "gpt-4o"}, "toc_detector": {"toc_check_page_num": 5}}
+    
+    merged = merge_configs(base, overrides)
+    
+    assert merged["global"] == {"model": "gpt-4o", "log_dir": "./logs"}
+    assert merged["toc_detector"] == {"toc_check_page_num": 5}
+    assert merged["pdf_parser"] is base["pdf_parser"]
+    assert base["global"]["model"] == "gpt-4.1-mini"
+    assert "toc_detector" not in base
+    print("✅ Merge configs isolation test passed")
+
+def test_field_checks_report_first_failure():
+    """Test that table-driven field checks keep their per-field messages"""
+    cases = [
+        ({"structure_verifier": {"accuracy_threshold": 1.5}}, "Accuracy threshold must be between 0.0 and 1.0"),
+        ({"structure_processor": {"if_add_node_text": "maybe"}}, "if_add_node_text must be either 'yes' or 'no'"),
+        ({"global": {"retry_attempts": 0}}, "Retry attempts must be between 1 and 10"),
+    ]
+    for config_dict, message in cases:
+        try:
+            PageIndexConfig.from_dict(config_dict)
+            assert False, f"Expected PageIndexError for {config_dict}"
+        except PageIndexError as e:
+            assert message in str(e)
+    print("✅ Field check messages test passed")
+
+def test_repeated_from_dict_skips_revalidation():
+    """Test that an identical config dict is only validated once per process"""
+    from unittest.mock import patch
+    
+    config_dict = {"global": {"model": "gpt-4o-2024-08-06", "retry_attempts": 4}}
+    PageIndexConfig.from_dict(config_dict)
+    with patch("core.config_schema._check_fields") as mock_check:
+        config = PageIndexConfig.from_dict({"global": {"retry_attempts": 4, "model": "gpt-4o-2024-08-06"}})
+    
+    assert config.global_config.retry_attempts == 4
+    mock_check.assert_not_called()
+    print("✅ Validation memo test passed")
+
+def test_validation_memo_is_bounded():
+    """Test that distinct config dicts do not grow the validation memo without limit"""
+    from core import config_schema
+    
+    for index in range(config_schema._VALIDATED_KEYS_SIZE + 10):
+        PageIndexConfig.from_dict({"global": {"model": f"gpt-memo-{index}"}})
+    
+    assert len(config_schema._validated_keys) == config_schema._VALIDATED_KEYS_SIZE
+    print("✅ Validation memo bound test passed")
+
+if __name__ == "__main__":
+    # Tests take pytest fixtures, so run them through pytest
+    sys.exit(pytest.main([__file__, "-v"]))
@@ -4,10 +4,12 @@ Unit tests for the context module
 
 import unittest
 import tempfile
-import json
+from datetime import datetime
 from pathlib import Path
 
-from core.context import PageIndexContext
+import orjson
+
+from core.context import PageIndexContext, checkpoint_delta_path, load_checkpoint
 from core.config_schema import PageIndexConfig
 
 
@@ -16,8 +18,10 @@ class TestPageIndexContext(unittest.TestCase):
     
     def setUp(self):
         """Set up test data"""
-        # Create a temporary directory for test logs
-        self.test_log_dir = Path(tempfile.mkdtemp(prefix="pageindex_test_"))
+        # Create a temporary directory for test logs, removed even if the test fails
+        temp_dir = tempfile.TemporaryDirectory(prefix="pageindex_test_")
+        self.addCleanup(temp_dir.cleanup)
+        self.test_log_dir = Path(temp_dir.name)
         
         # Create a real config instance
         self.config = PageIndexConfig()
@@ -56,7 +60,7 @@ class TestPageIndexContext(unittest.TestCase):
         self.assertEqual(context.structure_raw, [])
         self.assertEqual(context.structure_verified, [])
         self.assertEqual(context.structure_final, {})
-        self.assertEqual(context.processing_log, [])
+        self.assertEqual(list(context.processing_log), [])
         self.assertEqual(context.current_step, "initialized")
     
     def test_log_step(self):
@@ -75,6 +79,31 @@ class TestPageIndexContext(unittest.TestCase):
         self.assertIn("timestamp", log_entry)
         self.assertEqual(context.current_step, "pdf_parser_started")
     
+    def test_processing_log_is_bounded(self):
+        """Test that the processing log keeps only the newest max_log_entries steps"""
+        config = PageIndexConfig.from_dict({"global": {"max_log_entries": 5}})
+        context = PageIndexContext(config)
+        
+        for i in range(8):
+            context.log_step("tool", f"step_{i}")
+        
+        self.assertEqual(len(context.processing_log), 5)
+        self.assertEqual(context.processing_log[0]["status"], "step_3")
+        self.assertEqual(context.to_dict()["processing_log"][-1]["status"], "step_7")
+    
+    def test_restored_processing_log_is_bounded(self):
+        """Test that from_dict keeps the default log bound for long restored logs"""
+        steps = [{"tool": "tool", "status": f"step_{i}", "details": {}} for i in range(10_000)]
+        context = PageIndexContext.from_dict({"config": {}, "processing_log": steps})
+        
+        maxlen = context.config.global_config.max_log_entries
+        self.assertEqual(len(context.processing_log), maxlen)
+        self.assertEqual(context.processing_log[-1]["status"], "step_9999")
+        self.assertEqual(
+            [step["status"] for step in context.to_dict()["processing_log"]],
+            [f"step_{i}" for i in range(9995, 10_000)]
+        )
+    
     def test_save_and_load_pages(self):
         """Test save_pages and load_pages methods"""
         context = PageIndexContext(self.config)
@@ -89,10 +118,26 @@ class TestPageIndexContext(unittest.TestCase):
         
         # Load pages
         loaded_pages = context.load_pages()
-        # When JSON loads data, tuples become lists, so we need to convert them back
+        # orjson writes tuples as JSON arrays, which load back as lists
         converted_pages = [tuple(page) for page in loaded_pages]
         self.assertEqual(converted_pages, self.test_pages)
     
+    def test_save_and_load_binary_pages(self):
+        """Test the binary pages format round-trips tuples and embeds in checkpoints"""
+        config = PageIndexConfig.from_dict({"global": {"pages_format": "binary"}})
+        context = PageIndexContext(config)
+        pages = self.test_pages + [("Seite vier — Übersicht", 80)]
+        
+        context.save_pages(pages, self.test_log_dir)
+        self.assertTrue(context.pages_file.endswith(".bin"))
+        self.assertEqual(context.load_pages(), pages)
+        
+        context.save_checkpoint(self.test_log_dir, include_pages=True)
+        checkpoint_path = self.test_log_dir / f"{context.session_id}_checkpoint.json"
+        with open(checkpoint_path, 'rb') as f:
+            checkpoint_data = orjson.loads(f.read())
+        self.assertEqual([tuple(page) for page in checkpoint_data["pages_data"]], pages)
+    
     def test_load_pages_empty(self):
         """Test load_pages when no pages file exists"""
         context = PageIndexContext(self.config)
@@ -114,19 +159,24 @@ class TestPageIndexContext(unittest.TestCase):
         # Save checkpoint
         context.save_checkpoint(self.test_log_dir)
         
-        # Check that checkpoint file was created
+        # Check that checkpoint file was created, with no temporary file left behind
         checkpoint_path = self.test_log_dir / f"{context.session_id}_checkpoint.json"
         self.assertTrue(checkpoint_path.exists())
+        self.assertEqual(list(self.test_log_dir.glob("*.tmp")), [])
         
         # Load and verify checkpoint
-        with open(checkpoint_path, 'r', encoding='utf-8') as f:
-            checkpoint_data = json.load(f)
+        with open(checkpoint_path, 'rb') as f:
+            checkpoint_data = orjson.loads(f.read())
         
         self.assertEqual(checkpoint_data["session_id"], context.session_id)
         self.assertEqual(checkpoint_data["pdf_metadata"], context.pdf_metadata)
         self.assertEqual(checkpoint_data["toc_info"], context.toc_info)
         self.assertEqual(checkpoint_data["structure_raw"], context.structure_raw)
         self.assertEqual(len(checkpoint_data["processing_log"]), 1)  # Only last 5 steps
+        
+        # Epoch timestamps are written out as ISO 8601
+        self.assertIsInstance(context.processing_log[0]["timestamp"], float)
+        datetime.fromisoformat(checkpoint_data["processing_log"][0]["timestamp"])
     
     def test_save_checkpoint_with_pages(self):
         """Test save_checkpoint method with pages data"""
@@ -143,14 +193,64 @@ class TestPageIndexContext(unittest.TestCase):
         self.assertTrue(checkpoint_path.exists())
         
         # Load and verify checkpoint
-        with open(checkpoint_path, 'r', encoding='utf-8') as f:
-            checkpoint_data = json.load(f)
+        with open(checkpoint_path, 'rb') as f:
+            checkpoint_data = orjson.loads(f.read())
         
         self.assertIn("pages_data", checkpoint_data)
-        # When JSON loads data, tuples become lists, so we need to convert them back
+        # orjson writes tuples as JSON arrays, which load back as lists
         converted_pages = [tuple(page) for page in checkpoint_data["pages_data"]]
         self.assertEqual(converted_pages, self.test_pages)
     
+    def test_save_checkpoint_references_unchanged_pages(self):
+        """Test that repeated checkpoints reference pages instead of re-embedding them"""
+        context = PageIndexContext(self.config)
+        context.save_pages(self.test_pages, self.test_log_dir)
+        
+        # First checkpoint embeds pages, the second only references them
+        context.save_checkpoint(self.test_log_dir, include_pages=True)
+        context.save_checkpoint(self.test_log_dir, include_pages=True)
+        
+        checkpoint_path = self.test_log_dir / f"{context.session_id}_checkpoint.json"
+        with open(checkpoint_path, 'rb') as f:
+            checkpoint_data = orjson.loads(f.read())
+        
+        self.assertNotIn("pages_data", checkpoint_data)
+        self.assertEqual(checkpoint_data["pages_ref"], context.pages_file)
+    
+    def test_incremental_checkpoints_append_deltas(self):
+        """Test that saves after the first append changed fields until compaction"""
+        config = PageIndexConfig.from_dict({"global": {"max_checkpoint_deltas": 2}})
+        context = PageIndexContext(config)
+        context.pdf_metadata = {"pdf_name": "test.pdf"}
+        checkpoint_path = self.test_log_dir / f"{context.session_id}_checkpoint.json"
+        delta_path = checkpoint_delta_path(checkpoint_path)
+        
+        context.save_checkpoint(self.test_log_dir)
+        base = checkpoint_path.read_bytes()
+        self.assertFalse(delta_path.exists())
+        
+        # Later saves leave the base alone and record only what changed
+        context.structure_raw = self.test_structure
+        context.log_step("structure_extractor", "completed")
+        context.save_checkpoint(self.test_log_dir)
+        context.log_step("structure_verifier", "completed")
+        context.save_checkpoint(self.test_log_dir)
+        self.assertEqual(checkpoint_path.read_bytes(), base)
+        records = [orjson.loads(line) for line in delta_path.read_bytes().splitlines()]
+        self.assertIn("structure_raw", records[0])
+        self.assertNotIn("structure_raw", records[1])
+        self.assertNotIn("pdf_metadata", records[0])
+        
+        checkpoint = load_checkpoint(checkpoint_path)
+        self.assertEqual(checkpoint["pdf_metadata"], {"pdf_name": "test.pdf"})
+        self.assertEqual(checkpoint["structure_raw"], self.test_structure)
+        self.assertEqual(checkpoint["current_step"], "structure_verifier_completed")
+        
+        # Past max_checkpoint_deltas the base is rewritten and the log dropped
+        context.save_checkpoint(self.test_log_dir)
+        self.assertFalse(delta_path.exists())
+        self.assertEqual(orjson.loads(checkpoint_path.read_bytes()), checkpoint)
+    
     def test_to_dict(self):
         """Test to_dict method"""
         context = PageIndexContext(self.config)
@@ -184,6 +284,13 @@ class TestPageIndexContext(unittest.TestCase):
         
         # Check that config is serialized correctly
         self.assertIsInstance(context_dict["config"], dict)
+        
+        # Nested state is shared with the context, not copied
+        self.assertIs(context_dict["structure_final"], context.structure_final)
+        self.assertIs(context_dict["structure_raw"], context.structure_raw)
+        
+        # A restored context hands back the config dict it was built from
+        self.assertIs(PageIndexContext.from_dict(context_dict).to_dict()["config"], context_dict["config"])
     
     def test_from_dict(self):
         """Test from_dict method"""
@@ -208,6 +315,16 @@ class TestPageIndexContext(unittest.TestCase):
         self.assertEqual(new_context.processing_log, original_context.processing_log)
         self.assertEqual(new_context.current_step, original_context.current_step)
     
+    def test_from_dict_preserves_config(self):
+        """Test that the serialized config round-trips, including the global section"""
+        config = PageIndexConfig.from_dict({"global": {"model": "gpt-4o", "log_dir": "./custom_logs"}})
+        context = PageIndexContext(config)
+        
+        new_context = PageIndexContext.from_dict(context.to_dict())
+        
+        self.assertEqual(new_context.config, config)
+        self.assertEqual(new_context.config.global_config.log_dir, "./custom_logs")
+    
     def test_from_dict_with_missing_fields(self):
         """Test from_dict method with missing fields"""
         # Create dictionary with missing fields
@@ -227,7 +344,7 @@ class TestPageIndexContext(unittest.TestCase):
         self.assertEqual(context.structure_raw, [])
         self.assertEqual(context.structure_verified, [])
         self.assertEqual(context.structure_final, {})
-        self.assertEqual(context.processing_log, [])
+        self.assertEqual(list(context.processing_log), [])
         self.assertEqual(context.current_step, "initialized")
 
 
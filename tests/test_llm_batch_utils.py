@@ -2,9 +2,16 @@
 Unit tests for the llm_batch_utils module
 """
 
+import os
+import shutil
+import tempfile
 import unittest
 import asyncio
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import openai
+
+from core.cache_utils import CACHE_DIR_ENV
 
 from core.llm_batch_utils import LLMBatcher, BatchItem, BatchResult, batch_summarize_nodes
 
@@ -64,6 +71,26 @@ class TestLLMBatcher(unittest.TestCase):
         batcher_default = LLMBatcher()
         self.assertEqual(batcher_default.model, "gpt-4")
         self.assertEqual(batcher_default.max_tokens, 120000)
+        self.assertTrue(batcher_default.dedupe)
+    
+    @patch('openai.AsyncOpenAI')
+    def test_batcher_closes_its_own_client(self, mock_async_openai):
+        """Test that a batcher closes the client it opens and leaves an injected one open"""
+        response = MagicMock()
+        response.choices[0].message.content = '{"results": [{"id": "item_1", "result": {"title": "Intro"}}]}'
+        owned = mock_async_openai.return_value.__aenter__.return_value
+        owned.chat.completions.create = AsyncMock(return_value=response)
+        injected = MagicMock()
+        injected.chat.completions.create = AsyncMock(return_value=response)
+        
+        for batcher in (LLMBatcher(model="gpt-4"), LLMBatcher(model="gpt-4", client=injected)):
+            results = asyncio.run(batcher.batch_toc_operations(self.test_items[:1], "transform_toc"))
+            self.assertIsNone(results[0].error)
+        
+        owned.chat.completions.create.assert_awaited_once()
+        injected.chat.completions.create.assert_awaited_once()
+        mock_async_openai.return_value.__aexit__.assert_awaited_once()
+        injected.__aexit__.assert_not_awaited()
     
     def test_build_summary_batch_prompt(self):
         """Test _build_summary_batch_prompt method"""
@@ -132,10 +159,10 @@ class TestLLMBatcher(unittest.TestCase):
         
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0].id, "extract_1")
-        self.assertEqual(results[0].result, '{"key": "value1"}')
+        self.assertEqual(results[0].result, '{"key":"value1"}')
         self.assertIsNone(results[0].error)
         self.assertEqual(results[1].id, "extract_2")
-        self.assertEqual(results[1].result, '{"key": "value2"}')
+        self.assertEqual(results[1].result, '{"key":"value2"}')
         self.assertIsNone(results[1].error)
     
     def test_parse_extraction_batch_response_invalid(self):
@@ -173,11 +200,205 @@ class TestLLMBatcher(unittest.TestCase):
         self.assertEqual(len(batches), 1)
         self.assertEqual(len(batches[0]), 3)
     
+    def test_batch_toc_operations_runs_batches_concurrently(self):
+        """Test that token-split batches are sent together and results keep item order"""
+        batches = [[item] for item in self.test_items]
+        in_flight = {"now": 0, "peak": 0}
+        
+        async def create(**kwargs):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            item_id = kwargs["messages"][0]["content"].split("\n§")[1].split("§")[0]
+            response = MagicMock()
+            response.choices[0].message.content = f'{{"results": [{{"id": "{item_id}", "result": {{"ok": true}}}}]}}'
+            return response
+        
+        # Small enough a limit that the unsplit fast path does not apply
+        batcher = LLMBatcher(model="gpt-4", max_tokens=100, client=MagicMock())
+        batcher.client.chat.completions.create = create
+        with patch.object(batcher, '_split_items_by_token_limit', return_value=batches):
+            results = asyncio.run(batcher.batch_toc_operations(self.test_items, "transform_toc"))
+        
+        self.assertEqual([result.id for result in results], ["item_1", "item_2", "item_3"])
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(in_flight["peak"], 3)
+    
+    def test_batch_toc_operations_splits_after_context_length_error(self):
+        """Test that small requests go out unsplit and are split only when the API rejects them"""
+        too_long = openai.BadRequestError(
+            "too long",
+            response=MagicMock(status_code=400),
+            body={"code": "context_length_exceeded"}
+        )
+        response = MagicMock()
+        response.choices[0].message.content = '{"results": [{"id": "item_1", "result": {"ok": true}}]}'
+        
+        batcher = LLMBatcher(model="gpt-4", client=MagicMock())
+        batcher.client.chat.completions.create = AsyncMock(side_effect=[too_long, response])
+        with patch.object(batcher, '_split_items_by_token_limit',
+                          return_value=[self.test_items[:1]]) as mock_split:
+            results = asyncio.run(batcher.batch_toc_operations(self.test_items[:1], "transform_toc"))
+        
+        mock_split.assert_called_once()
+        self.assertEqual(batcher.client.chat.completions.create.await_count, 2)
+        self.assertIsNone(results[0].error)
+    
+    @patch('core.tokens.count_batch')
+    @patch('core.tokens.count')
+    def test_split_items_skips_tokenizing_when_bytes_fit(self, mock_count_tokens, mock_count_tokens_batch):
+        """Test that items whose UTF-8 size fits the limit are batched without tokenizing"""
+        batches = self.batcher._split_items_by_token_limit(self.test_items, "Base prompt")
+        
+        self.assertEqual(batches, [self.test_items])
+        mock_count_tokens.assert_not_called()
+        mock_count_tokens_batch.assert_not_called()
+    
+    @patch('core.tokens.count_batch')
+    @patch('core.tokens.count')
+    def test_split_items_packs_first_fit_decreasing(self, mock_count_tokens, mock_count_tokens_batch):
+        """Test that items are bin-packed into fewer batches than sequential splitting"""
+        items = [BatchItem(id=f"item_{i}", content="x" * 20) for i in range(4)]
+        mock_count_tokens.return_value = 1
+        mock_count_tokens_batch.return_value = [5, 6, 4, 5]
+        batcher = LLMBatcher(model="gpt-4", max_tokens=11)
+        
+        packed = batcher._split_items_by_token_limit(items, "Base prompt")
+        sequential = batcher._split_items_by_token_limit(items, "Base prompt", contiguous=True)
+        
+        self.assertEqual([[item.id for item in batch] for batch in packed],
+                         [["item_0", "item_3"], ["item_1", "item_2"]])
+        self.assertEqual(len(sequential), 3)
+    
+    @patch('core.tokens.enc_for')
+    @patch('core.tokens.count')
+    def test_split_items_reuses_cached_token_counts(self, mock_count_tokens, mock_enc_for):
+        """Test that splitting the same items again does not re-encode them"""
+        items = [BatchItem(id=f"cached_{i}", content=f"cached token count {i} " * 5) for i in range(3)]
+        mock_count_tokens.return_value = 1
+        mock_enc_for.return_value.encode_batch.side_effect = lambda texts: [[0] * 5 for _ in texts]
+        batcher = LLMBatcher(model="gpt-4", max_tokens=12)
+        
+        first = batcher._split_items_by_token_limit(items, "Base prompt")
+        second = batcher._split_items_by_token_limit(items, "Base prompt")
+        
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), 2)
+        mock_enc_for.return_value.encode_batch.assert_called_once()
+    
     def test_split_items_by_token_limit_empty(self):
         """Test _split_items_by_token_limit with empty items"""
         batches = self.batcher._split_items_by_token_limit([], "Base prompt")
         self.assertEqual(batches, [])
 
+    
+    def test_batch_summarize_reuses_cached_response(self):
+        """Test that a repeated deterministic batch call is answered from the response cache"""
+        cache_dir = tempfile.mkdtemp(prefix="pageindex_cache_test_")
+        try:
+            with patch.dict(os.environ, {CACHE_DIR_ENV: cache_dir}):
+                batcher = LLMBatcher(model="gpt-4")
+            
+            batcher.client = MagicMock()
+            batcher.client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: _stream_deltas(
+                '{"summaries": [{"id": "item_1", "summary": "Summary 1"}]}'
+            ))
+            
+            first = asyncio.run(batcher.batch_summarize(self.test_items[:1]))
+            second = asyncio.run(batcher.batch_summarize(self.test_items[:1]))
+            
+            self.assertEqual(first, second)
+            self.assertEqual(second[0].result, "Summary 1")
+            self.assertEqual(batcher.client.chat.completions.create.await_count, 1)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    
+    def test_iter_batch_summarize_yields_before_stream_ends(self):
+        """Test that each summary is yielded as soon as its object closes in the stream"""
+        stream_state = {"done": False}
+        
+        async def stream():
+            async for chunk in _stream_deltas(
+                '```json\n{"summaries": [{"id": "item_2", "sum', 'mary": "Two"}, ',
+                '{"id": "item_1", "summary": "One"}', ']}\n```'
+            ):
+                yield chunk
+            stream_state["done"] = True
+        
+        batcher = LLMBatcher(model="gpt-4", client=MagicMock())
+        batcher.client.chat.completions.create = AsyncMock(return_value=stream())
+        
+        async def collect():
+            seen = []
+            async for result in batcher.iter_batch_summarize(self.test_items):
+                seen.append((result.id, result.error is None, stream_state["done"]))
+            return seen
+        
+        seen = asyncio.run(collect())
+        
+        self.assertEqual(seen[:2], [("item_2", True, False), ("item_1", True, False)])
+        self.assertEqual(seen[2][:2], ("item_3", False))
+    
+    def test_batch_summarize_sends_identical_content_once(self):
+        """Test that items sharing content are summarized by one request item"""
+        items = [
+            BatchItem(id="item_1", content="Shared boilerplate"),
+            BatchItem(id="item_2", content="Distinct content"),
+            BatchItem(id="item_3", content="Shared boilerplate")
+        ]
+        batcher = LLMBatcher(model="gpt-4", client=MagicMock())
+        batcher.client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: _stream_deltas(
+            '{"summaries": [{"id": "item_1", "summary": "Shared"}, {"id": "item_2", "summary": "Distinct"}]}'
+        ))
+        
+        results = asyncio.run(batcher.batch_summarize(items))
+        
+        self.assertEqual([(r.id, r.result) for r in results],
+                         [("item_1", "Shared"), ("item_2", "Distinct"), ("item_3", "Shared")])
+        prompt = batcher.client.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+        self.assertEqual(prompt.count("Shared boilerplate"), 1)
+        self.assertNotIn("item_3", prompt)
+        
+        # Opting out sends every item
+        batcher.dedupe = False
+        asyncio.run(batcher.batch_summarize(items))
+        prompt = batcher.client.chat.completions.create.call_args.kwargs["messages"][0]["content"]
+        self.assertEqual(prompt.count("Shared boilerplate"), 2)
+
+    def test_batch_summarize_runs_split_batches_concurrently(self):
+        """Test that batches over the token limit stream together up to max_concurrency"""
+        in_flight = {"now": 0, "peak": 0}
+        
+        async def create(**kwargs):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            item_id = "item_" + kwargs["messages"][0]["content"].split("§item_")[1].split("§")[0]
+            
+            async def stream():
+                await asyncio.sleep(0.01)
+                async for chunk in _stream_deltas(f'{{"summaries": [{{"id": "{item_id}", "summary": "S"}}]}}'):
+                    yield chunk
+                in_flight["now"] -= 1
+            return stream()
+        
+        batcher = LLMBatcher(model="gpt-4", client=MagicMock())
+        batcher.max_concurrency = 2
+        batcher.client.chat.completions.create = create
+        with patch.object(batcher, '_split_items_by_token_limit',
+                          return_value=[[item] for item in self.test_items]):
+            results = asyncio.run(batcher.batch_summarize(self.test_items))
+        
+        self.assertEqual([r.id for r in results], ["item_1", "item_2", "item_3"])
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(in_flight["peak"], 2)
+
+async def _stream_deltas(*deltas):
+    """Streamed completion chunks carrying the given content deltas"""
+    for delta in deltas:
+        chunk = MagicMock()
+        chunk.choices[0].delta.content = delta
+        yield chunk
 
 class TestBatchSummarizeNodes(unittest.TestCase):
     """Unit tests for batch_summarize_nodes function"""
@@ -209,7 +430,7 @@ class TestBatchSummarizeNodes(unittest.TestCase):
         result = asyncio.run(batch_summarize_nodes(self.test_nodes, "gpt-4"))
         
         # Check that the batcher was called
-        mock_batcher_class.assert_called_once_with("gpt-4")
+        mock_batcher_class.assert_called_once_with("gpt-4", client=None)
         
         # Check results
         self.assertIsInstance(result, dict)
@@ -241,6 +462,50 @@ class TestBatchSummarizeNodes(unittest.TestCase):
         # Should return empty dict on error
         self.assertEqual(result, {})
 
+    
+    @patch('core.llm_batch_utils.LLMBatcher')
+    def test_batch_summarize_nodes_reuses_cached_summaries(self, mock_batcher_class):
+        """Test that unchanged node text is served from the summary cache"""
+        mock_batcher_instance = AsyncMock()
+        mock_batcher_class.return_value = mock_batcher_instance
+        mock_batcher_instance.batch_summarize = AsyncMock(side_effect=lambda items: [
+            BatchResult(id=item.id, result=f"Summary of {item.id}") for item in items
+        ])
+        
+        cache_dir = tempfile.mkdtemp(prefix="pageindex_cache_test_")
+        try:
+            with patch.dict(os.environ, {CACHE_DIR_ENV: cache_dir}):
+                asyncio.run(batch_summarize_nodes(self.test_nodes, "gpt-4"))
+                
+                # Only the edited node is sent on the second run
+                edited_nodes = [dict(node) for node in self.test_nodes]
+                edited_nodes[1]["text"] += " An extra sentence was added in this revision."
+                result = asyncio.run(batch_summarize_nodes(edited_nodes, "gpt-4"))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        
+        second_items = mock_batcher_instance.batch_summarize.await_args_list[1].args[0]
+        self.assertEqual([item.id for item in second_items], ["Methods"])
+        self.assertEqual(result, {
+            "Introduction": "Summary of Introduction",
+            "Methods": "Summary of Methods"
+        })
+    
+    @patch('core.llm_batch_utils.LLMBatcher')
+    def test_batch_summarize_nodes_summarizes_repeated_text_once(self, mock_batcher_class):
+        """Test that nodes with identical text share one batched summary"""
+        mock_batcher_instance = AsyncMock()
+        mock_batcher_class.return_value = mock_batcher_instance
+        mock_batcher_instance.batch_summarize = AsyncMock(side_effect=lambda items: [
+            BatchResult(id=item.id, result=f"Summary of {item.id}") for item in items
+        ])
+        nodes = self.test_nodes + [{"title": "Appendix", "text": self.test_nodes[0]["text"]}]
+        
+        result = asyncio.run(batch_summarize_nodes(nodes, "gpt-4"))
+        
+        sent_items = mock_batcher_instance.batch_summarize.await_args.args[0]
+        self.assertEqual([item.id for item in sent_items], ["Introduction", "Methods"])
+        self.assertEqual(result["Appendix"], "Summary of Introduction")
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,21 +2,24 @@
 Unit tests for the PageIndexAgent class
 """
 
+import asyncio
+import shutil
 import unittest
 import tempfile
-import sys
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
-# Add the project root to the path so we can import the modules
-sys.path.insert(0, str(Path(__file__).parent.parent))
+from openai.types.chat import ChatCompletionChunk
 
-from agent.pageindex_agent import PageIndexAgent
+from agent.pageindex_agent import PageIndexAgent, _ToolCallRunner
+from agent.tool_registry import TOOL_VALIDATORS, make_batch_tool, with_context_handle
 from core.context import PageIndexContext
 from core.config import PageIndexConfig
 from core.config_schema import GlobalConfig
+from core.exceptions import PageIndexError, PageIndexToolError
 
 
+@patch('agent.pageindex_agent.openai.AsyncOpenAI')
 class TestPageIndexAgent(unittest.TestCase):
     """Unit tests for PageIndexAgent functionality"""
     
@@ -43,10 +46,8 @@ class TestPageIndexAgent(unittest.TestCase):
     
     def tearDown(self):
         """Clean up test files"""
-        import shutil
         shutil.rmtree(self.test_dir, ignore_errors=True)
     
-    @patch('agent.pageindex_agent.openai.OpenAI')
     def test_init(self, mock_openai):
         """Test PageIndexAgent initialization"""
         # Mock the OpenAI client
@@ -73,7 +74,6 @@ class TestPageIndexAgent(unittest.TestCase):
                 mock_openai.assert_called_once()
                 mock_config_manager_instance.load_config.assert_called_once_with(None)
     
-    @patch('agent.pageindex_agent.openai.OpenAI')
     def test_create_system_prompt(self, mock_openai):
         """Test _create_system_prompt method"""
         # Mock the OpenAI client
@@ -105,7 +105,6 @@ class TestPageIndexAgent(unittest.TestCase):
                 self.assertIn("Structure Verifier", prompt)
                 self.assertIn("Structure Processor", prompt)
     
-    @patch('agent.pageindex_agent.openai.OpenAI')
     def test_list_sessions_empty(self, mock_openai):
         """Test list_sessions method with no sessions"""
         # Mock the OpenAI client
@@ -132,7 +131,44 @@ class TestPageIndexAgent(unittest.TestCase):
                 self.assertIsInstance(sessions, list)
                 self.assertEqual(len(sessions), 0)
     
-    @patch('agent.pageindex_agent.openai.OpenAI')
+    def test_list_sessions_with_checkpoint(self, mock_openai):
+        """Test list_sessions reads saved checkpoints and caches them"""
+        # Mock the OpenAI client
+        mock_client = MagicMock()
+        mock_openai.return_value = mock_client
+        
+        # Mock ConfigManager
+        with patch('agent.pageindex_agent.ConfigManager') as mock_config_manager:
+            mock_config_manager_instance = MagicMock()
+            mock_config_manager.return_value = mock_config_manager_instance
+            mock_config_manager_instance.load_config.return_value = self.test_config
+            
+            # Mock register_tool_functions
+            with patch('agent.pageindex_agent.register_tool_functions') as mock_register:
+                mock_register.return_value = {}
+                
+                # Create agent and save a checkpoint for the test session
+                agent = PageIndexAgent()
+                session_dir = self.test_dir / "logs" / "test_session"
+                session_dir.mkdir(parents=True, exist_ok=True)
+                self.test_context.save_checkpoint(session_dir)
+                
+                sessions = agent.list_sessions()
+                
+                # Assertions
+                self.assertEqual(len(sessions), 1)
+                self.assertEqual(sessions[0]["session_id"], "test_session")
+                self.assertEqual(sessions[0]["pdf_name"], "test.pdf")
+                self.assertIn("test_session", agent._session_cache)
+                
+                # Unchanged checkpoints come from the cache
+                self.assertEqual(agent.list_sessions(), sessions)
+                
+                # Status is read from the same checkpoint
+                status = agent.get_processing_status("test_session")
+                self.assertEqual(status["status"], "found")
+                self.assertEqual(status["current_step"], self.test_context.current_step)
+    
     def test_get_processing_status_not_found(self, mock_openai):
         """Test get_processing_status method with non-existent session"""
         # Mock the OpenAI client
@@ -158,6 +194,301 @@ class TestPageIndexAgent(unittest.TestCase):
                 # Assertions
                 self.assertIsInstance(status, dict)
                 self.assertEqual(status["status"], "not_found")
+    
+    def test_request_turn_uses_cache(self, mock_openai):
+        """Test that identical agent requests are answered from the LLM cache"""
+        chunk = ChatCompletionChunk.model_validate({
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-3.5-turbo",
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": "done"}, "finish_reason": None}]
+        })
+        
+        async def stream():
+            yield chunk
+        
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: stream())
+        mock_openai.return_value = mock_client
+        
+        # Mock ConfigManager
+        with patch('agent.pageindex_agent.ConfigManager') as mock_config_manager:
+            mock_config_manager_instance = MagicMock()
+            mock_config_manager.return_value = mock_config_manager_instance
+            mock_config_manager_instance.load_config.return_value = self.test_config
+            
+            # Mock register_tool_functions
+            with patch('agent.pageindex_agent.register_tool_functions') as mock_register:
+                mock_register.return_value = {}
+                
+                agent = PageIndexAgent()
+                messages = [{"role": "user", "content": "Process PDF document: test.pdf"}]
+                
+                async def request_turn():
+                    runner = _ToolCallRunner(agent, self.test_context)
+                    return await agent._request_turn(messages, self.test_context, runner)
+                
+                first = asyncio.run(request_turn())
+                second = asyncio.run(request_turn())
+                
+                # Assertions
+                mock_client.chat.completions.create.assert_awaited_once()
+                self.assertEqual(first, {"role": "assistant", "content": "done"})
+                self.assertEqual(second, first)
+                self.assertEqual(agent._llm_cache_stats, {"hits": 1, "misses": 1})
+                self.assertEqual(self.test_context.processing_log[-1]["status"], "llm_cache_hit")
+    
+    def test_failed_tool_turn_is_not_replayed_from_cache(self, mock_openai):
+        """Test that a retry after a tool failure asks the model again"""
+        chunks = [
+            ChatCompletionChunk.model_validate({
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+            })
+            for delta in [
+                {"role": "assistant", "content": "Parsing"},
+                {"tool_calls": [{"index": 0, "id": "call_1", "type": "function",
+                                 "function": {"name": "pdf_parser", "arguments": '{"pdf_path": "test.pdf"}'}}]}
+            ]
+        ]
+        
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        
+        mock_client = MagicMock()
+        mock_client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: stream())
+        mock_openai.return_value = mock_client
+        
+        def failing_parser(context, pdf_path):
+            return {"success": False, "context": context, "errors": ["unreadable"]}
+        
+        # Mock ConfigManager
+        with patch('agent.pageindex_agent.ConfigManager') as mock_config_manager:
+            mock_config_manager_instance = MagicMock()
+            mock_config_manager.return_value = mock_config_manager_instance
+            mock_config_manager_instance.load_config.return_value = self.test_config
+            
+            # Mock register_tool_functions
+            with patch('agent.pageindex_agent.register_tool_functions') as mock_register:
+                mock_register.side_effect = lambda context_store: {
+                    "pdf_parser": with_context_handle(failing_parser, context_store)
+                }
+                
+                agent = PageIndexAgent()
+                for _ in range(2):
+                    with self.assertRaises(PageIndexError), patch('builtins.print'):
+                        asyncio.run(agent.process_pdf("test.pdf"))
+                
+                # Assertions
+                self.assertEqual(mock_client.chat.completions.create.await_count, 2)
+                self.assertEqual(agent._llm_cache, {})
+    
+    def test_tool_call_runner_chains_calls(self, mock_openai):
+        """Test that each tool call starts from the previous call's context"""
+        mock_openai.return_value = MagicMock()
+        seen_metadata = []
+        
+        def fake_parser(context, pdf_path):
+            updated = dict(context, pdf_metadata={"pdf_name": pdf_path})
+            return {"success": True, "context": updated, "metrics": {}}
+        
+        def fake_detector(context):
+            seen_metadata.append(context["pdf_metadata"])
+            updated = dict(context, toc_info={"found": False})
+            return {"success": True, "context": updated, "metrics": {"toc_found": False}}
+        
+        # Mock ConfigManager
+        with patch('agent.pageindex_agent.ConfigManager') as mock_config_manager:
+            mock_config_manager_instance = MagicMock()
+            mock_config_manager.return_value = mock_config_manager_instance
+            mock_config_manager_instance.load_config.return_value = self.test_config
+            
+            # Mock register_tool_functions
+            with patch('agent.pageindex_agent.register_tool_functions') as mock_register:
+                mock_register.side_effect = lambda context_store: {
+                    "pdf_parser": with_context_handle(fake_parser, context_store),
+                    "toc_detector": with_context_handle(fake_detector, context_store)
+                }
+                
+                agent = PageIndexAgent()
+                
+                async def run_turn():
+                    runner = _ToolCallRunner(agent, self.test_context)
+                    runner.submit({"id": "call_1", "type": "function",
+                                   "function": {"name": "pdf_parser", "arguments": '{"pdf_path": "parsed.pdf"}'}})
+                    runner.submit({"id": "call_2", "type": "function",
+                                   "function": {"name": "toc_detector", "arguments": ""}})
+                    return await runner.results()
+                
+                outcomes = asyncio.run(run_turn())
+                
+                # Assertions
+                self.assertEqual(seen_metadata, [{"pdf_name": "parsed.pdf"}])
+                result, context = outcomes[1]
+                self.assertTrue(result["success"])
+                self.assertEqual(context.toc_info, {"found": False})
+                self.assertEqual(agent._context_store, {})
+    
+    def test_tool_call_runner_keeps_repeated_tool_changes(self, mock_openai):
+        """Test that two calls to the same tool both keep their context changes"""
+        mock_openai.return_value = MagicMock()
+        
+        def fake_processor(context, enhancements):
+            applied = context["structure_final"].get("applied", []) + enhancements
+            updated = dict(context, structure_final={"applied": applied})
+            return {"success": True, "context": updated, "metrics": {}}
+        
+        # Mock ConfigManager
+        with patch('agent.pageindex_agent.ConfigManager') as mock_config_manager:
+            mock_config_manager_instance = MagicMock()
+            mock_config_manager.return_value = mock_config_manager_instance
+            mock_config_manager_instance.load_config.return_value = self.test_config
+            
+            # Mock register_tool_functions
+            with patch('agent.pageindex_agent.register_tool_functions') as mock_register:
+                mock_register.side_effect = lambda context_store: {
+                    "structure_processor": with_context_handle(fake_processor, context_store)
+                }
+                
+                agent = PageIndexAgent()
+                
+                async def run_turn():
+                    runner = _ToolCallRunner(agent, self.test_context)
+                    runner.submit({"id": "call_1", "type": "function", "function": {
+                        "name": "structure_processor", "arguments": '{"enhancements": ["node_ids"]}'}})
+                    runner.submit({"id": "call_2", "type": "function", "function": {
+                        "name": "structure_processor", "arguments": '{"enhancements": ["summaries"]}'}})
+                    return await runner.results()
+                
+                outcomes = asyncio.run(run_turn())
+                
+                # Assertions
+                self.assertTrue(all(result["success"] for result, _ in outcomes))
+                self.assertEqual(outcomes[-1][1].structure_final, {"applied": ["node_ids", "summaries"]})
+    
+    def test_tool_call_runner_skips_calls_after_failure(self, mock_openai):
+        """Test that calls after a failed tool call are never run"""
+        mock_openai.return_value = MagicMock()
+        
+        def failing_parser(context, pdf_path):
+            return {"success": False, "context": context, "errors": ["unreadable"]}
+        
+        fake_detector = MagicMock()
+        
+        # Mock ConfigManager
+        with patch('agent.pageindex_agent.ConfigManager') as mock_config_manager:
+            mock_config_manager_instance = MagicMock()
+            mock_config_manager.return_value = mock_config_manager_instance
+            mock_config_manager_instance.load_config.return_value = self.test_config
+            
+            # Mock register_tool_functions
+            with patch('agent.pageindex_agent.register_tool_functions') as mock_register:
+                mock_register.side_effect = lambda context_store: {
+                    "pdf_parser": with_context_handle(failing_parser, context_store),
+                    "toc_detector": fake_detector
+                }
+                
+                agent = PageIndexAgent()
+                
+                async def run_turn():
+                    runner = _ToolCallRunner(agent, self.test_context)
+                    runner.submit({"id": "call_1", "type": "function",
+                                   "function": {"name": "pdf_parser", "arguments": '{"pdf_path": "test.pdf"}'}})
+                    runner.submit({"id": "call_2", "type": "function",
+                                   "function": {"name": "toc_detector", "arguments": ""}})
+                    return await runner.results()
+                
+                outcomes = asyncio.run(run_turn())
+                
+                # Assertions
+                self.assertFalse(outcomes[0][0]["success"])
+                self.assertIsNone(outcomes[1])
+                fake_detector.assert_not_called()
+                self.assertEqual(agent._context_store, {})
+    
+    def test_batch_tool_runs_invocations_in_order(self, _mock_openai):
+        """Test that the batch meta-tool chains dependent invocations and reports each result"""
+        context_store = {"session": self.test_context}
+        
+        def fake_parser(context, pdf_path):
+            updated = dict(context, pdf_metadata={"pdf_name": pdf_path})
+            return {"success": True, "context": updated, "metrics": {"pages_extracted": 3}}
+        
+        def fake_detector(context):
+            updated = dict(context, toc_info={"found": context["pdf_metadata"]["pdf_name"] == "batch.pdf"})
+            return {"success": True, "context": updated, "metrics": {"toc_found": True}}
+        
+        tools = {
+            "pdf_parser": with_context_handle(fake_parser, context_store),
+            "toc_detector": with_context_handle(fake_detector, context_store)
+        }
+        batch_tool = make_batch_tool(tools, context_store)
+        
+        result = asyncio.run(batch_tool("session", [
+            {"tool_name": "pdf_parser", "arguments": {"pdf_path": "batch.pdf"}},
+            {"tool_name": "toc_detector"}
+        ]))
+        
+        # Assertions
+        self.assertTrue(result["success"])
+        self.assertEqual([r["tool_name"] for r in result["results"]], ["pdf_parser", "toc_detector"])
+        self.assertEqual(context_store["session"].toc_info, {"found": True})
+        self.assertEqual(list(context_store), ["session"])
+        
+        # Invalid invocation arguments fail the batch without running later invocations
+        result = asyncio.run(batch_tool("session", [
+            {"tool_name": "pdf_parser", "arguments": {}},
+            {"tool_name": "toc_detector"}
+        ]))
+        self.assertFalse(result["success"])
+        self.assertEqual(len(result["results"]), 1)
+        self.assertIn("pdf_path", result["errors"][0])
+    
+    def test_batch_tool_keeps_repeated_tool_changes(self, _mock_openai):
+        """Test that batched calls to the same tool run in turn and keep each change"""
+        context_store = {"session": self.test_context}
+        
+        def fake_processor(context, enhancements):
+            applied = context["structure_final"].get("applied", []) + enhancements
+            updated = dict(context, structure_final={"applied": applied})
+            return {"success": True, "context": updated, "metrics": {}}
+        
+        batch_tool = make_batch_tool(
+            {"structure_processor": with_context_handle(fake_processor, context_store)}, context_store
+        )
+        
+        result = asyncio.run(batch_tool("session", [
+            {"tool_name": "structure_processor", "arguments": {"enhancements": ["node_ids"]}},
+            {"tool_name": "structure_processor", "arguments": {"enhancements": ["summaries"]}}
+        ]))
+        
+        # Assertions
+        self.assertTrue(result["success"])
+        self.assertEqual(context_store["session"].structure_final, {"applied": ["node_ids", "summaries"]})
+        self.assertEqual(list(context_store), ["session"])
+    
+    def test_tool_validators(self, _mock_openai):
+        """Test that tool arguments are checked against the tool schemas"""
+        # Valid arguments pass
+        TOOL_VALIDATORS["pdf_parser"]({"pdf_path": "test.pdf"})
+        TOOL_VALIDATORS["structure_processor"]({"enhancements": ["node_ids", "summaries"]})
+        
+        # Missing required property
+        with self.assertRaises(PageIndexToolError) as cm:
+            TOOL_VALIDATORS["pdf_parser"]({})
+        self.assertIn("pdf_path", str(cm.exception))
+        
+        # Values outside the enum
+        with self.assertRaises(PageIndexToolError):
+            TOOL_VALIDATORS["structure_extractor"]({"strategy": "guess"})
+        with self.assertRaises(PageIndexToolError) as cm:
+            TOOL_VALIDATORS["structure_processor"]({"enhancements": ["colors"]})
+        self.assertIn("arguments.enhancements[0]", str(cm.exception))
 
 
 if __name__ == '__main__':
@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from tools.pdf_parser import pdf_parser_tool
@@ -10,7 +11,10 @@ class TestPDFParserTool(unittest.TestCase):
     def setUp(self):
         """Set up test configuration and context"""
         self.config_manager = ConfigManager()
-        self.config = self.config_manager.load_config()
+        
+        temp_dir = tempfile.TemporaryDirectory(prefix="pageindex_test_")
+        self.addCleanup(temp_dir.cleanup)
+        self.config = self.config_manager.load_config({"global": {"log_dir": temp_dir.name}})
         self.context = PageIndexContext(self.config)
         
     @patch('tools.pdf_parser.get_page_tokens')
@@ -2,13 +2,18 @@
 Integration tests for the full PageIndex Agent pipeline
 """
 
+import asyncio
+import shutil
 import unittest
 import tempfile
 import json
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from openai.types.chat import ChatCompletionChunk
 
 from agent.pageindex_agent import PageIndexAgent
+from agent.tool_registry import with_context_handle
 from core.config import ConfigManager
 
 
@@ -32,11 +37,10 @@ class TestPipelineIntegration(unittest.TestCase):
         """Clean up test files"""
         # Clean up test log directory
         if self.test_log_dir.exists():
-            import shutil
             shutil.rmtree(self.test_log_dir)
     
     @patch('agent.pageindex_agent.register_tool_functions')
-    @patch('openai.OpenAI')
+    @patch('openai.AsyncOpenAI')
     @patch('core.utils.get_page_tokens')
     def test_full_pipeline_with_toc_and_page_numbers(self, mock_get_page_tokens, mock_openai, mock_register_tool_functions):
         """Test full pipeline with TOC and page numbers"""
@@ -75,13 +79,16 @@ class TestPipelineIntegration(unittest.TestCase):
         mock_structure_processor = MagicMock()
         
         # Mock register_tool_functions to return our mocked tool functions
-        mock_register_tool_functions.return_value = {
+        mock_tools = {
             "pdf_parser": mock_pdf_parser,
             "toc_detector": mock_toc_detector,
             "structure_extractor": mock_structure_extractor,
             "structure_verifier": mock_structure_verifier,
             "structure_processor": mock_structure_processor
         }
+        mock_register_tool_functions.side_effect = lambda context_store: {
+            name: with_context_handle(tool, context_store) for name, tool in mock_tools.items()
+        }
         
         # Mock tool function responses with proper context
         # Each mock needs to return the context that would be passed to the next tool
@@ -162,7 +169,7 @@ class TestPipelineIntegration(unittest.TestCase):
         
         try:
             # Run the pipeline
-            result = agent.process_pdf(self.pdf_path)
+            result = asyncio.run(agent.process_pdf(self.pdf_path))
             
             # Verify result structure
             self.assertIsInstance(result, dict)
@@ -176,6 +183,9 @@ class TestPipelineIntegration(unittest.TestCase):
             mock_structure_verifier.assert_called()
             mock_structure_processor.assert_called()
             
+            # The loop stops once the final structure exists, skipping the closing turn
+            self.assertEqual(mock_client.chat.completions.create.await_count, 5)
+            
         finally:
             # Clean up
             Path(self.pdf_path).unlink()
@@ -233,33 +243,51 @@ class TestPipelineIntegration(unittest.TestCase):
             self._create_mock_response(None, "Processing completed successfully")
         ]
         
-        mock_client.chat.completions.create.side_effect = mock_responses
+        mock_client.chat.completions.create = AsyncMock(side_effect=iter(mock_responses))
     
     def _create_mock_response(self, tool_calls, content):
-        """Create a mock response for the OpenAI client"""
-        mock_response = MagicMock()
-        mock_choice = MagicMock()
-        mock_message = MagicMock()
+        """Create a mock streamed response for the OpenAI client"""
+        deltas = [{"role": "assistant", "content": content}]
+        for index, tool_call in enumerate(tool_calls or []):
+            # Header first, then the arguments, as the API streams them
+            deltas.append({"tool_calls": [{
+                "index": index,
+                "id": tool_call["id"],
+                "type": "function",
+                "function": {"name": tool_call["function"]["name"], "arguments": ""}
+            }]})
+            deltas.append({"tool_calls": [{
+                "index": index,
+                "function": {"arguments": tool_call["function"]["arguments"]}
+            }]})
+        
+        chunks = [
+            ChatCompletionChunk.model_validate({
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "gpt-4",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+            })
+            for delta in deltas
+        ]
         
-        mock_message.tool_calls = tool_calls
-        mock_message.content = content
-        mock_choice.message = mock_message
-        mock_response.choices = [mock_choice]
+        async def stream():
+            for chunk in chunks:
+                yield chunk
         
-        return mock_response
+        return stream()
     
     def _create_mock_tool_call(self, id, function_name, arguments):
-        """Create a mock tool call with proper structure"""
-        mock_tool_call = MagicMock()
-        mock_function = MagicMock()
-        
-        mock_function.name = function_name
-        mock_function.arguments = json.dumps(arguments) if isinstance(arguments, dict) else arguments
-        mock_tool_call.function = mock_function
-        mock_tool_call.id = id
-        mock_tool_call.type = "function"
-        
-        return mock_tool_call
+        """Create a tool call in the API's streamed dict shape"""
+        return {
+            "id": id,
+            "type": "function",
+            "function": {
+                "name": function_name,
+                "arguments": json.dumps(arguments) if isinstance(arguments, dict) else arguments
+            }
+        }
 
 if __name__ == '__main__':
     unittest.main()
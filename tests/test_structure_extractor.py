@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from tools.structure_extractor import structure_extractor_tool, transform_toc_to_json
@@ -9,7 +10,10 @@ class TestStructureExtractorTool(unittest.TestCase):
     def setUp(self):
         """Set up test configuration and context"""
         self.config_manager = ConfigManager()
-        self.config = self.config_manager.load_config()
+        
+        temp_dir = tempfile.TemporaryDirectory(prefix="pageindex_test_")
+        self.addCleanup(temp_dir.cleanup)
+        self.config = self.config_manager.load_config({"global": {"log_dir": temp_dir.name}})
         self.context = PageIndexContext(self.config)
         
         # Mock TOC info
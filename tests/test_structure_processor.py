@@ -2,15 +2,16 @@
 Unit tests for the structure_processor module
 """
 
+import asyncio
 import unittest
 import tempfile
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from tools.structure_processor import (
     safe_int_conversion, add_preface_if_needed, build_tree_structure, 
     list_to_tree, apply_enhancements, add_node_ids, add_node_text_recursive,
-    remove_node_text, count_nodes, calculate_tree_depth
+    remove_node_text, count_nodes, calculate_tree_depth, add_summaries
 )
 
 
@@ -19,8 +20,10 @@ class TestStructureProcessor(unittest.TestCase):
     
     def setUp(self):
         """Set up test data"""
-        # Create a temporary directory for test logs
-        self.test_log_dir = Path(tempfile.mkdtemp(prefix="pageindex_test_"))
+        # Create a temporary directory for test logs, removed even if the test fails
+        temp_dir = tempfile.TemporaryDirectory(prefix="pageindex_test_")
+        self.addCleanup(temp_dir.cleanup)
+        self.test_log_dir = Path(temp_dir.name)
         
         # Create a mock context
         self.mock_context = MagicMock()
@@ -309,6 +312,23 @@ class TestStructureProcessor(unittest.TestCase):
         
         result = calculate_tree_depth(structure)
         self.assertEqual(result, 3)  # Root -> Section -> Subsection
+    
+    @patch('openai.AsyncOpenAI')
+    def test_add_summaries_closes_client_per_run(self, mock_async_openai):
+        """Test that each add_summaries run closes the client it opened"""
+        text = " ".join(["word"] * 30)
+        client = mock_async_openai.return_value.__aenter__.return_value
+        
+        with patch('tools.structure_processor.batch_summarize_nodes',
+                   AsyncMock(return_value={"Chapter 1": "Summary"})) as mock_batch:
+            for _ in range(20):
+                structure = [{"title": "Chapter 1", "text": text}]
+                asyncio.run(add_summaries(structure, self.mock_pages, "gpt-3.5-turbo", self.mock_context))
+                self.assertEqual(structure[0]["summary"], "Summary")
+        
+        # The batch shares the run's client, and every client is closed with its run
+        self.assertIs(mock_batch.call_args.args[2], client)
+        self.assertEqual(mock_async_openai.return_value.__aexit__.await_count, 20)
 
 
 if __name__ == '__main__':
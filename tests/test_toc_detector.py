@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from tools.toc_detector import toc_detector_tool, detect_toc_single_page
@@ -9,7 +10,10 @@ class TestTOCDetectorTool(unittest.TestCase):
     def setUp(self):
         """Set up test configuration and context"""
         self.config_manager = ConfigManager()
-        self.config = self.config_manager.load_config()
+        
+        temp_dir = tempfile.TemporaryDirectory(prefix="pageindex_test_")
+        self.addCleanup(temp_dir.cleanup)
+        self.config = self.config_manager.load_config({"global": {"log_dir": temp_dir.name}})
         self.context = PageIndexContext(self.config)
         
         # Mock pages data
@@ -20,21 +24,29 @@ class TestTOCDetectorTool(unittest.TestCase):
             ("Chapter 1: Introduction", 40)
         ]
         
+        # LLM detection calls are stubbed for every test; by default no page
+        # is a TOC, and tests override the results they need
+        self.mock_detect = self._start_patch('tools.toc_detector.detect_toc_single_page', return_value='no')
+        self.mock_page_nums = self._start_patch('tools.toc_detector.detect_page_numbers_in_toc', return_value=True)
+    
+    def _start_patch(self, target, **kwargs):
+        """Patch target until the test finishes and return the mock"""
+        patcher = patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+        
     def test_toc_detector_with_toc_found(self):
         """Test TOC detector when TOC is found"""
         with patch('tools.toc_detector.PageIndexContext.load_pages') as mock_load, \
-             patch('tools.toc_detector.detect_toc_single_page') as mock_detect, \
-             patch('tools.toc_detector.extract_toc_content') as mock_extract, \
-             patch('tools.toc_detector.detect_page_numbers_in_toc') as mock_page_nums:  # Mock the client to prevent instantiation
+             patch('tools.toc_detector.extract_toc_content') as mock_extract:
 
             # Setup mocks
             mock_load.return_value = self.mock_pages
-            mock_detect.side_effect = ['no', 'yes', 'yes', 'no']  # TOC on pages 1 and 2
+            self.mock_detect.side_effect = ['no', 'yes', 'yes', 'no']  # TOC on pages 1 and 2
             mock_extract.return_value = {
                 "content": "1. Introduction ... 1\n2. Methods ... 5",
                 "has_page_numbers": True
             }
-            mock_page_nums.return_value = True
 
             result = toc_detector_tool(self.context.to_dict())
 
@@ -46,12 +58,10 @@ class TestTOCDetectorTool(unittest.TestCase):
 
     def test_toc_detector_no_toc_found(self):
         """Test TOC detector when no TOC is found"""
-        with patch.object(self.context, 'load_pages') as mock_load, \
-             patch('tools.toc_detector.detect_toc_single_page') as mock_detect:
+        with patch.object(self.context, 'load_pages') as mock_load:
 
-            # Setup mocks
+            # Setup mocks; setUp's detection stub already reports no TOC
             mock_load.return_value = self.mock_pages
-            mock_detect.return_value = 'no'  # No TOC found
 
             result = toc_detector_tool(self.context.to_dict())
 
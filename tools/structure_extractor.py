@@ -1,5 +1,6 @@
 from typing import Dict, Any, List
 import json
+import asyncio
 import openai
 import copy
 import math
@@ -8,6 +9,7 @@ from core.config import PageIndexConfig
 from core.context import PageIndexContext
 from core.exceptions import PageIndexToolError
 from core.utils import extract_json, count_tokens, create_recovery_suggestions
+from core.async_utils import openai_client
 from core.llm_batch_utils import LLMBatcher, BatchItem
 
 def structure_extractor_tool(context: Dict[str, Any], strategy: str) -> Dict[str, Any]:
@@ -254,8 +256,7 @@ def extract_with_toc_no_pages(pages: List[tuple], toc_info: Dict[str, Any],
     if len(group_texts) > 1:
         # Use batch processing for multiple groups
         try:
-            from core.async_utils import run_async_safe
-            toc_with_indices = run_async_safe(batch_match_toc_to_content(group_texts, toc_with_indices, model))
+            toc_with_indices = asyncio.run(batch_match_toc_to_content(group_texts, toc_with_indices, model))
             context.log_step("structure_extractor", "batch_toc_matching_success", {"groups": len(group_texts)})
         except Exception as e:
             context.log_step("structure_extractor", "batch_toc_matching_failed", {"error": str(e)})
@@ -296,8 +297,7 @@ def extract_without_toc(pages: List[tuple], config: PageIndexConfig,
     if len(group_texts) > 1:
         # Use batch processing for multiple groups
         try:
-            from core.async_utils import run_async_safe
-            structure = run_async_safe(batch_generate_structure_from_content(group_texts, model))
+            structure = asyncio.run(batch_generate_structure_from_content(group_texts, model))
             context.log_step("structure_extractor", "batch_structure_generation_success", {"groups": len(group_texts)})
         except Exception as e:
             context.log_step("structure_extractor", "batch_structure_generation_failed", {"error": str(e)})
@@ -367,7 +367,7 @@ async def batch_transform_toc_to_json(toc_contents: List[str], model: str) -> Li
     batch_items = []
     for i, toc_content in enumerate(toc_contents):
         # Check token count before adding to batch
-        content_tokens = count_tokens(toc_content)
+        content_tokens = count_tokens(toc_content, model)
         if content_tokens > 50000:  # Conservative limit for TOC content
             print(f"Warning: TOC content {i} too large ({content_tokens} tokens), processing individually")
             # Process large TOC individually
@@ -506,8 +506,8 @@ async def batch_match_toc_to_content(content_chunks: List[str], toc_items: List[
     
     for i, content in enumerate(content_chunks):
         # Check token count to prevent overflow
-        content_tokens = count_tokens(content)
-        toc_tokens = count_tokens(json.dumps(current_toc_state, indent=2))
+        content_tokens = count_tokens(content, model)
+        toc_tokens = count_tokens(json.dumps(current_toc_state, indent=2), model)
         total_tokens = content_tokens + toc_tokens + 500  # Buffer for prompt
         
         if total_tokens > 100000:  # Conservative limit
@@ -682,7 +682,7 @@ async def batch_generate_structure_from_content_experimental(content_chunks: Lis
     batch_items = []
     for i, content in enumerate(content_chunks):
         # Check token count before adding to batch
-        content_tokens = count_tokens(content)
+        content_tokens = count_tokens(content, model)
         if content_tokens > 80000:  # Conservative limit for structure generation
             print(f"Warning: Content chunk {i} too large ({content_tokens} tokens), processing individually")
             # Process large chunk individually and add to results later
@@ -727,52 +727,53 @@ OUTPUT FORMAT:
 """
         
         # Split into token-aware batches
-        batches = batcher._split_items_by_token_limit(batch_items, base_prompt)
+        batches = batcher._split_items_by_token_limit(batch_items, base_prompt, contiguous=True)
         
         all_structure = []
-        for batch in batches:
-            try:
-                # Build batch prompt
-                batch_prompt = base_prompt
-                for item in batch:
-                    batch_prompt += f"ID: {item.id}\n"
-                    batch_prompt += f"Document Content:\n{item.content}\n\n"
-                
-                response = await batcher.client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": batch_prompt}],
-                    temperature=0,
-                )
-                
-                # Parse batch response
+        async with openai_client(batcher.client) as client:
+            for batch in batches:
                 try:
-                    response_data = json.loads(response.choices[0].message.content)
-                    results = response_data.get("results", [])
+                    # Build batch prompt
+                    batch_prompt = base_prompt
+                    for item in batch:
+                        batch_prompt += f"ID: {item.id}\n"
+                        batch_prompt += f"Document Content:\n{item.content}\n\n"
                     
-                    # Sort results by chunk index to maintain order
-                    sorted_results = sorted(results, key=lambda x: int(x.get("id", "content_chunk_0").split("_")[-1]))
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": batch_prompt}],
+                        temperature=0,
+                    )
                     
-                    for result in sorted_results:
-                        structure_items = result.get("result", [])
-                        all_structure.extend(structure_items)
+                    # Parse batch response
+                    try:
+                        response_data = json.loads(response.choices[0].message.content)
+                        results = response_data.get("results", [])
+                        
+                        # Sort results by chunk index to maintain order
+                        sorted_results = sorted(results, key=lambda x: int(x.get("id", "content_chunk_0").split("_")[-1]))
                         
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing batch response: {e}")
+                        for result in sorted_results:
+                            structure_items = result.get("result", [])
+                            all_structure.extend(structure_items)
+                            
+                    except json.JSONDecodeError as e:
+                        print(f"Error parsing batch response: {e}")
+                        # Fallback to individual processing for this batch
+                        for item in batch:
+                            chunk_index = item.metadata["chunk_index"]
+                            if chunk_index < len(content_chunks):
+                                structure = generate_structure_from_content(content_chunks[chunk_index], model)
+                                all_structure.extend(structure)
+                            
+                except Exception as e:
+                    print(f"Error in batch structure generation: {e}")
                     # Fallback to individual processing for this batch
                     for item in batch:
                         chunk_index = item.metadata["chunk_index"]
                         if chunk_index < len(content_chunks):
                             structure = generate_structure_from_content(content_chunks[chunk_index], model)
                             all_structure.extend(structure)
-                        
-            except Exception as e:
-                print(f"Error in batch structure generation: {e}")
-                # Fallback to individual processing for this batch
-                for item in batch:
-                    chunk_index = item.metadata["chunk_index"]
-                    if chunk_index < len(content_chunks):
-                        structure = generate_structure_from_content(content_chunks[chunk_index], model)
-                        all_structure.extend(structure)
         
         return all_structure
         
@@ -6,7 +6,7 @@ from typing import Dict, Any, List
 from core.context import PageIndexContext
 from core.exceptions import PageIndexToolError
 from core.utils import create_recovery_suggestions
-from core.async_utils import run_async_safe
+from core.async_utils import openai_client
 from core.llm_batch_utils import batch_summarize_nodes
 
 def safe_int_conversion(value) -> int:
@@ -87,7 +87,7 @@ def structure_processor_tool(context: Dict[str, Any],
         
         # Check for start appearance (beginning of sections)
         context.log_step("structure_processor", "checking_section_starts")
-        structure_with_starts = run_async_safe(
+        structure_with_starts = asyncio.run(
             check_section_starts(structure_with_preface, pages, model, context)
         )
         
@@ -97,7 +97,7 @@ def structure_processor_tool(context: Dict[str, Any],
         
         # Process large nodes recursively if needed
         context.log_step("structure_processor", "processing_large_nodes")
-        final_tree = run_async_safe(
+        final_tree = asyncio.run(
             process_large_nodes_recursive(tree_structure, pages, processor_config, model, context)
         )
         
@@ -115,7 +115,7 @@ def structure_processor_tool(context: Dict[str, Any],
         # Add document description if requested
         if "doc_description" in enhancements:
             context.log_step("structure_processor", "generating_doc_description")
-            result["doc_description"] = run_async_safe(generate_document_description(enhanced_structure, model))
+            result["doc_description"] = asyncio.run(generate_document_description(enhanced_structure, model))
         
         context.structure_final = result
         
@@ -361,7 +361,7 @@ def apply_enhancements(structure: List[Dict[str, Any]], pages: List[tuple],
             add_node_text_recursive(copied_structure, pages, context)
         
         # Generate summaries asynchronously
-        run_async_safe(add_summaries(copied_structure, pages, model, context))
+        asyncio.run(add_summaries(copied_structure, pages, model, context))
         
         if "node_text" not in enhancements:
             remove_node_text(copied_structure)
@@ -432,6 +432,12 @@ def remove_node_text(structure: List[Dict[str, Any]]):
 
 async def add_summaries(structure: List[Dict[str, Any]], pages: List[tuple], model: str, context):
     """Generate summaries for all nodes with text using efficient batching"""
+    async with openai_client() as client:
+        await _add_summaries(structure, pages, model, context, client)
+
+
+async def _add_summaries(structure: List[Dict[str, Any]], pages: List[tuple], model: str, context, client):
+    """add_summaries over an open AsyncOpenAI client, shared by the batch and its fallbacks"""
     
     context.log_step("add_summaries", "starting_summaries")
     
@@ -477,7 +483,7 @@ async def add_summaries(structure: List[Dict[str, Any]], pages: List[tuple], mod
         
         try:
             # Use batch processing for all summaries
-            summaries = await batch_summarize_nodes(nodes_to_summarize, model)
+            summaries = await batch_summarize_nodes(nodes_to_summarize, model, client)
             
             # Apply summaries back to original nodes using reliable mapping
             success_count = 0
@@ -502,7 +508,6 @@ async def add_summaries(structure: List[Dict[str, Any]], pages: List[tuple], mod
                     
                     # Individual fallback processing
                     try:
-                        client = openai.AsyncOpenAI()
                         prompt = f"""You are given a part of a document, your task is to generate a description of the partial document about what are main points covered in the partial document.
 
                         Partial Document Text: {node_entry['text']}
@@ -540,7 +545,6 @@ async def add_summaries(structure: List[Dict[str, Any]], pages: List[tuple], mod
             
             for node_entry in nodes_to_summarize:
                 try:
-                    client = openai.AsyncOpenAI()
                     prompt = f"""You are given a part of a document, your task is to generate a description of the partial document about what are main points covered in the partial document.
 
                     Partial Document Text: {node_entry['text']}
@@ -6,7 +6,6 @@ from typing import Dict, Any, List
 from core.context import PageIndexContext
 from core.exceptions import PageIndexToolError
 from core.utils import extract_json, create_recovery_suggestions
-from core.async_utils import run_async_safe
 
 def structure_verifier_tool(context: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -52,7 +51,7 @@ def structure_verifier_tool(context: Dict[str, Any]) -> Dict[str, Any]:
         
         # Verify structure accuracy
         context.log_step("structure_verifier", "verifying_accuracy")
-        accuracy, incorrect_items = run_async_safe(
+        accuracy, incorrect_items = asyncio.run(
             verify_structure_accuracy(validated_structure, pages, model, client)
         )
         